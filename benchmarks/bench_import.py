@@ -0,0 +1,64 @@
+# bench_import.py is part of SpiralSort
+#
+# SpiralSort is free software; you may redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version. You should have received a copy of the GNU
+# General Public License along with this program. If not, see
+# <https://www.gnu.org/licenses/>.
+#
+# (C) 2020 Athanasios Mattas
+# ======================================================================
+"""Benchmarks the startup of the CLI and the imports of the modules, at
+fresh interpreters, along with the heavy modules that each one loads.
+
+--help, --version and the usage errors should not load any of them;
+io loads pandas, but not numba; core loads numba and the kernels.
+
+usage: python benchmarks/bench_import.py [repeats]
+       (default 5, the best time is reported)
+"""
+
+import subprocess
+import sys
+from timeit import default_timer as timer
+
+
+HEAVY_MODULES = ("numba", "numpy", "pandas", "matplotlib")
+
+COMMANDS = {
+    "spiralsort --version": "import spiralsort.__main__ as m;"
+                            " m.main(['--version'], standalone_mode=False)",
+    "spiralsort --help": "import spiralsort.__main__ as m;"
+                         " m.main(['--help'], standalone_mode=False)",
+    "import spiralsort.utils": "import spiralsort.utils",
+    "import spiralsort.io": "import spiralsort.io",
+    "import spiralsort.core": "import spiralsort.core",
+}
+
+REPORT = ("import sys; print(' '.join(m for m in {!r} if m in sys.modules),"
+          " file=sys.stderr)".format(HEAVY_MODULES))
+
+
+def startup(code):
+    """the duration of a fresh interpreter running code and the heavy
+    modules that it loaded"""
+    start = timer()
+    run = subprocess.run([sys.executable, "-c", code + "; " + REPORT],
+                         stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                         check=True, text=True)
+    return timer() - start, run.stderr.strip()
+
+
+def main(repeats):
+    baseline = min(startup("pass")[0] for _ in range(repeats))
+    print(f"{'command':<25} {'time (s)':>9} {'imports (s)':>12}  loaded")
+    for command, code in COMMANDS.items():
+        runs = [startup(code) for _ in range(repeats)]
+        duration = min(duration for duration, _ in runs)
+        print(f"{command:<25} {duration:>9.3f} {duration - baseline:>12.3f}"
+              f"  {runs[-1][1] or '-'}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if sys.argv[1:] else 5)
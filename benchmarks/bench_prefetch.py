@@ -0,0 +1,105 @@
+# bench_prefetch.py is part of SpiralSort
+#
+# SpiralSort is free software; you may redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version. You should have received a copy of the GNU
+# General Public License along with this program. If not, see
+# <https://www.gnu.org/licenses/>.
+#
+# (C) 2020 Athanasios Mattas
+# ======================================================================
+"""Benchmarks the out-of-core stride loop, with and without loading the
+next slice in the background.
+
+Besides the loop durations, it reports the time spent loading the
+slices and the time that the stride loop waited for them, when they are
+prefetched. The difference is the loading that overlapped the popping.
+
+usage: python benchmarks/bench_prefetch.py [num_nodes ...]
+       (default 300000 1000000)
+"""
+
+import os
+import sys
+import tempfile
+from timeit import default_timer as timer
+
+from spiralsort import core, external
+from bench_window_selection import random_cloud
+
+
+def timed(durations, func):
+    """func, appending the duration of each call to durations"""
+    def wrapper(*args):
+        start = timer()
+        result = func(*args)
+        durations.append(timer() - start)
+        return result
+    return wrapper
+
+
+def timed_iter(durations, items):
+    """items, appending the time waited for each one to durations"""
+    items = iter(items)
+    while True:
+        start = timer()
+        try:
+            item = next(items)
+        except StopIteration:
+            return
+        durations.append(timer() - start)
+        yield item
+
+
+def loop_duration(xyz, start_row, radial_rows, radial_d, prefetch):
+    """times the stride loop over the staged work files
+
+    Returns:
+        duration (float)
+        loading (float)   :  the time spent loading the slices
+        waited (float)    :  the time the loop waited for them
+    """
+    load_slice = external._load_slice
+    prefetched = core._prefetched
+    loading, waited = [], []
+    external._load_slice = timed(loading, load_slice)
+    core._prefetched = lambda *args: timed_iter(waited, prefetched(*args))
+    try:
+        start = timer()
+        for _ in external._spiral_strides_external(xyz, start_row,
+                                                   radial_rows, radial_d,
+                                                   "partition", prefetch):
+            pass
+        duration = timer() - start
+    finally:
+        external._load_slice = load_slice
+        core._prefetched = prefetched
+    return duration, sum(loading), sum(waited) if prefetch else sum(loading)
+
+
+def main(sizes):
+    print(f"{'nodes':>9} {'serial (s)':>11} {'prefetch (s)':>13}"
+          f" {'loading (s)':>12} {'waited (s)':>11}")
+    for num_nodes in sizes:
+        with tempfile.TemporaryDirectory() as work_dir:
+            file_path = os.path.join(work_dir, "cloud.csv")
+            random_cloud(num_nodes).to_csv(file_path, index=False)
+            xyz, _, start_row = external._stage(file_path, "0", work_dir,
+                                                num_nodes)
+            run_paths = external._sorted_runs(xyz, start_row, work_dir,
+                                              num_nodes)
+            radial = external._merge_runs(run_paths, work_dir, num_nodes)
+            # compile (or load) the kernels outside the timings
+            loop_duration(xyz, start_row, *radial, False)
+            serial, loading, _ = loop_duration(xyz, start_row, *radial,
+                                               False)
+            prefetch, _, waited = loop_duration(xyz, start_row, *radial,
+                                                True)
+            del xyz, radial
+        print(f"{num_nodes:>9} {serial:>11.2f} {prefetch:>13.2f}"
+              f" {loading:>12.3f} {waited:>11.3f}")
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [300000, 1000000])
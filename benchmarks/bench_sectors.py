@@ -0,0 +1,68 @@
+# bench_sectors.py is part of SpiralSort
+#
+# SpiralSort is free software; you may redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version. You should have received a copy of the GNU
+# General Public License along with this program. If not, see
+# <https://www.gnu.org/licenses/>.
+#
+# (C) 2020 Athanasios Mattas
+# ======================================================================
+"""Benchmarks spiralsorted_sectors against the sequential spiralsorted,
+on duration and on spiral_quality.
+
+rank shift is the mean displacement of a node between the two orders,
+as a fraction of the number of nodes.
+
+usage: python benchmarks/bench_sectors.py [num_nodes ...]
+       (default 300000 1000000)
+"""
+
+import sys
+from timeit import default_timer as timer
+
+import numpy as np
+
+from spiralsort import config, core
+from bench_window_selection import random_cloud
+
+
+def timed_order(func, *args, **kwargs):
+    """the order that func returns and its duration"""
+    start = timer()
+    order = func.__wrapped__(*args, return_order=True, **kwargs)
+    return order, timer() - start
+
+
+def main(sizes):
+    # compile (or load) the kernels outside the timings
+    core.spiralsorted(random_cloud(3000), "0", engine="numpy")
+
+    print(f"{'nodes':>9} {'mode':>12} {'time (s)':>9} {'length':>10}"
+          f" {'max step':>9} {'ccw':>6} {'rank shift':>11}")
+    for num_nodes in sizes:
+        nodes = random_cloud(num_nodes)
+        # parallelize beyond the first tenth of the nodes
+        parallel_from = num_nodes // 10
+        sequential, duration = timed_order(core.spiralsorted, nodes, "0",
+                                           engine="numpy")
+        runs = [("sequential", sequential, duration)]
+        for num_sectors in (config.SECTORS, 4 * config.SECTORS):
+            order, duration = timed_order(core.spiralsorted_sectors, nodes,
+                                          "0", num_sectors,
+                                          parallel_from=parallel_from)
+            runs.append((f"{num_sectors} sectors", order, duration))
+
+        sequential_ranks = np.argsort(sequential)
+        for mode, order, duration in runs:
+            quality = core.spiral_quality(nodes, order)
+            rank_shift = np.abs(np.argsort(order) - sequential_ranks).mean() \
+                / num_nodes
+            print(f"{num_nodes:>9} {mode:>12} {duration:>9.2f}"
+                  f" {quality.path_length:>10.1f} {quality.max_step:>9.4f}"
+                  f" {quality.counterclockwise:>6.3f} {rank_shift:>11.4f}")
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [300000, 1000000])
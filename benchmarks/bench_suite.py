@@ -0,0 +1,243 @@
+# bench_suite.py is part of SpiralSort
+#
+# SpiralSort is free software; you may redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version. You should have received a copy of the GNU
+# General Public License along with this program. If not, see
+# <https://www.gnu.org/licenses/>.
+#
+# (C) 2020 Athanasios Mattas
+# ======================================================================
+"""Benchmarks spiralsort end to end and per phase, over the size and the
+shape of the point-cloud and the engine, storing the results as json.
+
+phases (see spiralsort.stats):
+    read     :  io.read_data_file of the csv point-cloud
+    radial   :  the distance-sort from the start node
+    strides  :  the slice loop, popping the strides
+    window   :  the spiral_window selections (in strides)
+    pop      :  the pops (in strides)
+    reorder  :  the gather of the sorted point-cloud
+    write    :  io.write_output of the csv output
+
+sort is spiralsorted end to end and total is read + sort + write. The
+pandas engine is timed up to PANDAS_MAX_NODES. Durations are the best of
+REPEATS runs, for clouds of up to REPEAT_MAX_NODES nodes.
+
+With --compare, the durations are checked against a previous results
+file and the script exits with 1 if any of them regressed by more than
+the tolerance (ignoring durations below NOISE_FLOOR seconds).
+
+usage: python benchmarks/bench_suite.py [-o results.json]
+           [-c baseline.json] [-t tolerance] [--shapes shell plane ...]
+           [num_nodes ...]
+       (default 1000 10000 100000 1000000 10000000, the largest ones
+        take long; results/spiralsort-<version>-<time>.json)
+"""
+
+import argparse
+from datetime import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+
+import numba as nb
+import numpy as np
+import pandas as pd
+
+import spiralsort
+from spiralsort import core, generators, io, stats
+
+
+SIZES = [1000, 10000, 100000, 1000000, 10000000]
+SHAPES = ["shell", "plane", "clusters", "gradient", "duplicates"]
+# (engine, window_selection)
+ENGINES = [("pandas", "sort"), ("numpy", "sort"), ("numpy", "partition")]
+PHASES = ["read", "radial", "strides", "window", "pop", "reorder", "write"]
+
+PANDAS_MAX_NODES = 100000
+REPEATS = 3
+REPEAT_MAX_NODES = 100000
+NOISE_FLOOR = 0.05
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                           "results")
+
+
+def cloud(shape, num_nodes, seed=0):
+    """a point-cloud of the shape (see spiralsort.generators) and its
+    topmost node, as the start node
+
+    Returns:
+        nodes (df)
+        start_node_id (str)
+    """
+    nodes = generators.point_cloud(shape, num_nodes, seed)
+    return nodes, nodes.node_id.iloc[int(nodes.z.values.argmax())]
+
+
+def run(input_file, output_file, start_node_id, engine, window_selection):
+    """reads, spiralsorts and writes the point-cloud once, timing each
+    phase
+
+    Returns:
+        durations (dict)  :  phase -> duration (s)
+    """
+    with stats.collecting() as collected:
+        with stats.phase("read"):
+            nodes = io.read_data_file(input_file)
+        with stats.phase("sort"):
+            sorted_nodes = core.spiralsorted.__wrapped__(
+                nodes, start_node_id, engine=engine,
+                window_selection=window_selection)
+        with stats.phase("write"):
+            io.write_output(sorted_nodes, output_file)
+    durations = collected.phases
+    durations["total"] = \
+        durations["read"] + durations["sort"] + durations["write"]
+    return durations
+
+
+def metadata():
+    """the versions and the machine that the results were taken at"""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+            text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {"spiralsort": spiralsort.__version__,
+            "commit": commit,
+            "date": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "numba": nb.__version__,
+            "machine": platform.machine(),
+            "processor": platform.processor(),
+            "cpus": os.cpu_count(),
+            "numba_threads": nb.config.NUMBA_NUM_THREADS}
+
+
+def result_key(result):
+    return (result["shape"], result["num_nodes"], result["engine"],
+            result["window_selection"])
+
+
+def regressions(results, baseline, tolerance):
+    """the durations of the results that are slower than the ones of the
+    baseline by more than the tolerance
+
+    Returns:
+        regressed (list)  :  (key, phase, baseline (s), duration (s))
+    """
+    baseline = {result_key(result): result["durations"]
+                for result in baseline["results"]}
+    regressed = []
+    for result in results:
+        previous = baseline.get(result_key(result), {})
+        for phase, duration in result["durations"].items():
+            if (phase in previous) and (duration > NOISE_FLOOR) \
+                    and (duration > previous[phase] * (1 + tolerance)):
+                regressed.append((result_key(result), phase,
+                                  previous[phase], duration))
+    return regressed
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        description="spiralsort benchmark suite",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument("sizes", nargs="*", type=int, default=SIZES,
+                        help="the numbers of nodes")
+    parser.add_argument("--shapes", nargs="+", choices=SHAPES,
+                        default=SHAPES)
+    parser.add_argument("-o", "--output", default=None,
+                        help="the results json  [default: results/"
+                             "spiralsort-<version>-<time>.json]")
+    parser.add_argument("-c", "--compare", default=None,
+                        help="a previous results json, to check for"
+                             " regressions")
+    parser.add_argument("-t", "--tolerance", type=float, default=0.2,
+                        help="the slowdown that counts as a regression")
+    return parser.parse_args(argv)
+
+
+def main(argv):
+    args = parse_args(argv)
+    output = args.output or os.path.join(
+        RESULTS_DIR,
+        f"spiralsort-{spiralsort.__version__}-"
+        f"{datetime.now():%Y%m%d-%H%M%S}.json"
+    )
+    results = []
+    print(f"{'shape':>10} {'nodes':>9} {'engine':>17}"
+          + "".join(f" {phase:>8}" for phase in PHASES + ["sort", "total"]))
+    with tempfile.TemporaryDirectory() as work_dir:
+        input_file = os.path.join(work_dir, "cloud.csv")
+        output_file = os.path.join(work_dir, "cloud_spiralsorted.csv")
+
+        # compile (or load) the kernels outside the timings
+        warm_up, start_node_id = cloud("shell", 3000)
+        warm_up.to_csv(input_file, index=False)
+        for engine, window_selection in ENGINES:
+            run(input_file, output_file, start_node_id, engine,
+                window_selection)
+
+        for num_nodes in args.sizes:
+            for shape in args.shapes:
+                nodes, start_node_id = cloud(shape, num_nodes)
+                nodes.to_csv(input_file, index=False)
+                del nodes
+                for engine, window_selection in ENGINES:
+                    if (engine == "pandas") \
+                            and (num_nodes > PANDAS_MAX_NODES):
+                        continue
+                    repeats = REPEATS if num_nodes <= REPEAT_MAX_NODES \
+                        else 1
+                    runs = [run(input_file, output_file, start_node_id,
+                                engine, window_selection)
+                            for _ in range(repeats)]
+                    durations = {phase: min(timings[phase]
+                                        for timings in runs)
+                                 for phase in runs[0]}
+                    results.append({"shape": shape,
+                                    "num_nodes": num_nodes,
+                                    "engine": engine,
+                                    "window_selection": window_selection,
+                                    "repeats": repeats,
+                                    "durations": durations})
+                    print(f"{shape:>10} {num_nodes:>9}"
+                          f" {engine + '/' + window_selection:>17}"
+                          + "".join(f" {durations[phase]:>8.3f}"
+                                    if phase in durations else f" {'-':>8}"
+                                    for phase in PHASES + ["sort",
+                                                           "total"]))
+
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as fw:
+        json.dump({"meta": metadata(), "results": results}, fw, indent=2)
+    print(f"results written to {output}")
+
+    if args.compare:
+        with open(args.compare) as fr:
+            baseline = json.load(fr)
+        regressed = regressions(results, baseline, args.tolerance)
+        for key, phase, previous, duration in regressed:
+            print(f"regression: {'/'.join(map(str, key))} {phase}"
+                  f" {previous:.3f} s -> {duration:.3f} s"
+                  f" ({duration / previous - 1:+.0%})")
+        print(f"{len(regressed)} regressions against {args.compare}"
+              f" (tolerance {args.tolerance:.0%})")
+        return 1 if regressed else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
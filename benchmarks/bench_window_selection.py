@@ -0,0 +1,74 @@
+# bench_window_selection.py is part of SpiralSort
+#
+# SpiralSort is free software; you may redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version. You should have received a copy of the GNU
+# General Public License along with this program. If not, see
+# <https://www.gnu.org/licenses/>.
+#
+# (C) 2020 Athanasios Mattas
+# ======================================================================
+"""Benchmarks the per-stride cost of each window_selection.
+
+usage: python benchmarks/bench_window_selection.py [num_nodes ...]
+       (default 100000 300000)
+"""
+
+import sys
+from timeit import default_timer as timer
+
+import numpy as np
+import pandas as pd
+
+from spiralsort import core, utils
+
+
+def random_cloud(num_nodes, seed=0):
+    """uniformly distributed nodes in the unit cube"""
+    rng = np.random.default_rng(seed)
+    x, y, z = rng.random((3, num_nodes), dtype=np.float32)
+    return pd.DataFrame({"node_id": np.arange(num_nodes).astype(str),
+                         'x': x, 'y': y, 'z': z})
+
+
+def stride_durations(nodes, start_node_id, window_selection):
+    """runs the numpy engine, timing each stride"""
+    _, rows, cloud = core._radial_sort_numpy(nodes, start_node_id)
+    strides = core._spiral_strides_numpy(cloud,
+                                         utils.create_slices(rows),
+                                         window_selection)
+    durations = []
+    while True:
+        start = timer()
+        try:
+            next(strides)
+        except StopIteration:
+            break
+        durations.append(timer() - start)
+    return np.array(durations)
+
+
+def main(sizes):
+    # compile (or load) the kernels outside the timings
+    warm_up = random_cloud(3000)
+    for window_selection in ("sort", "partition", "grid"):
+        stride_durations(warm_up, "0", window_selection)
+
+    print(f"{'nodes':>9} {'selection':>10} {'strides':>8}"
+          f" {'mean (ms)':>10} {'median (ms)':>12} {'total (s)':>10}"
+          f" {'speedup':>8}")
+    for num_nodes in sizes:
+        nodes = random_cloud(num_nodes)
+        sort_mean = None
+        for window_selection in ("sort", "partition", "grid"):
+            durations = stride_durations(nodes, "0", window_selection)
+            mean = durations.mean()
+            sort_mean = sort_mean or mean
+            print(f"{num_nodes:>9} {window_selection:>10} {len(durations):>8}"
+                  f" {mean * 1e3:>10.3f} {np.median(durations) * 1e3:>12.3f}"
+                  f" {durations.sum():>10.2f} {sort_mean / mean:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [100000, 300000])
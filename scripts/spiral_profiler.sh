@@ -1,11 +1,15 @@
 #!/bin/bash
 # script: spiral_profiler.sh
 # --------------------------
-# This script uses the line-profiler to produce a txt file with profilings
-# of the algorithm. You need to decorate with @profile each function that you
-# want to profile.
+# This script profiles the algorithm on the example point-cloud, with the
+# --profile option of spiralsort, producing (next to the point-cloud):
+# - point_cloud_example_profile.pstats  (cProfile, e.g. python -m pstats)
+# - point_cloud_example_profile.folded  (collapsed stacks, e.g. flamegraph.pl
+#                                        or speedscope)
+# and a txt file with the durations and the top functions of core.
 
 export PYTHONPATH="${PYTHONPATH}:.."
-kernprof -lv ../spiralsort/__main__.py \
-    ../examples/data_examples/point_cloud_example.csv N_4004 \
+python -m spiralsort \
+    ../examples/data_examples/point_cloud_example.csv N_4004 "$@" \
+    --profile \
     > profiling.txt
@@ -10,7 +10,9 @@ REQUIRED = ['click>=7.0',
 
 EXTRAS = {
     'animation': ['ffmpeg>=4.2.4', 'matplotlib>=3.1.3', 'pillow>=7.0.0'],
-    'test': ['pytest>=5.4.2']
+    'arrow': ['pyarrow>=1.0.0'],
+    'test': ['pytest>=5.4.2'],
+    'zstd': ['zstandard>=0.14.0']
 }
 
 here = os.path.abspath(os.path.dirname(__file__))
@@ -9,24 +9,160 @@
 #
 # (C) 2020 Athanasios Mattas
 # ======================================================================
-"""Main script that calls all necessary processes."""
+"""Main script that calls all necessary processes.
+
+Only click and the light helpers are imported at the top, so that
+--help, --version and usage errors return without loading numba, numpy
+or pandas. These are imported by main, when there is something to sort
+(see benchmarks/bench_import.py).
+"""
+
+from contextlib import nullcontext
+import glob
+import os
+from timeit import default_timer as timer
 
 import click
-import pandas as pd
 
-from spiralsort.core import spiralsorted
-from spiralsort import io
+from spiralsort import utils
 from spiralsort.utils import time_this
 
 
+def _load_kernels(cache_dir):
+    """imports the modules of the numba kernels, which compiles them, or
+    loads them from the cache (cache_dir, if given, is set before that,
+    for this and the worker processes)"""
+    if cache_dir is not None:
+        os.environ["NUMBA_CACHE_DIR"] = cache_dir
+    import numba as nb
+    if cache_dir is not None:
+        # when numba was already imported
+        nb.config.CACHE_DIR = cache_dir
+    from spiralsort import core
+    return core
+
+
+def _warmup(core):
+    """reports the numba kernels compiled or loaded from the cache"""
+    import numba as nb
+    kernels = core.numba_kernels()
+    hits = sum(sum(kernel.stats.cache_hits.values()) for kernel in kernels)
+    misses = sum(sum(kernel.stats.cache_misses.values())
+                 for kernel in kernels)
+    click.echo(f"{len(kernels)} numba kernels at"
+               f" {nb.config.CACHE_DIR or 'the default cache'}:"
+               f" {hits} loaded from the cache, {misses} compiled")
+
+
+def _check_usage(file_path, start_node_id, save_animation, batch, payload,
+                 limit, sectors, out_of_core, stats_file, profile, engine,
+                 compare, window_selection, output_format):
+    """raises the usage errors, before the kernels are loaded"""
+    if file_path is None:
+        raise click.UsageError("Missing argument 'FILE_PATH'.")
+    if window_selection == "grid":
+        if out_of_core:
+            raise click.UsageError("--window-selection grid is not"
+                                   " supported at the out-of-core mode.")
+        if (engine != "numpy") and not sectors:
+            raise click.UsageError("--window-selection grid requires the"
+                                   " numpy engine (-e numpy).")
+    if batch:
+        if save_animation or sectors or stats_file or profile:
+            raise click.UsageError("--save-animation, --sectors, --stats and"
+                                   " --profile are not supported at the"
+                                   " batch mode.")
+        return
+    if start_node_id is None:
+        raise click.UsageError("Missing argument 'START_NODE_ID'.")
+    if out_of_core and (save_animation or payload or limit or sectors
+                        or (engine is not None)):
+        raise click.UsageError("--save-animation, --payload, --limit,"
+                               " --sectors and --engine are not supported"
+                               " at the out-of-core mode.")
+    if out_of_core and (output_format is not None) \
+            and (output_format.split('.')[0] != "csv"):
+        raise click.UsageError("The out-of-core mode writes only csv,"
+                               " csv.gz or csv.zst files.")
+    if sectors and limit:
+        raise click.UsageError("--limit is not supported at the sectors"
+                               " mode.")
+    if sectors and (engine is not None):
+        raise click.UsageError("--engine is not supported at the sectors"
+                               " mode, which uses the numpy engine.")
+    if compare and not sectors:
+        raise click.UsageError("--compare is only supported at the sectors"
+                               " mode.")
+
+
 @click.command()
-@click.argument("file_path", type=click.Path())
-@click.argument("start_node_id")
+@click.argument("file_path", type=click.Path(), required=False)
+@click.argument("start_node_id", required=False)
 @click.option('-f', "--output-format", type=click.STRING,
               default=None, show_default=True,
-              help="defaults to the format of the input file")
+              help="csv, csv.gz, csv.zst, parquet, feather, npy, json or"
+                   " xlsx  [default: the format of the input file]")
 @click.option('-a', "--save-animation", is_flag=True,
               help="saves an animation of the stepwise spiralsorting process")
+@click.option('-e', "--engine", type=click.Choice(["pandas", "numpy"]),
+              default=None,
+              help="numpy keeps the point-cloud at contiguous arrays"
+                   "  [default: pandas]")
+@click.option('-w', "--window-selection",
+              type=click.Choice(["sort", "partition", "grid"]),
+              default="sort", show_default=True,
+              help="partition cost-selects spiral windows out of the"
+                   " counterclockwise filtered nodes, grid selects them via"
+                   " a voxel grid (numpy engine)")
+@click.option('-t', "--threads",
+              # numba's thread limit, without importing numba
+              type=click.IntRange(1, int(os.environ.get("NUMBA_NUM_THREADS")
+                                         or os.cpu_count())),
+              default=None,
+              help="the number of threads that search large spiral windows"
+                   " and compress csv outputs  [default: all cores]")
+@click.option('-b', "--batch", is_flag=True,
+              help="FILE_PATH is a manifest csv, with path and start_id"
+                   " columns, or a glob pattern of files that share the"
+                   " START_NODE_ID")
+@click.option('-p', "--processes", type=click.IntRange(1), default=None,
+              help="the worker processes of the batch and the sectors modes"
+                   "  [default: all cores]")
+@click.option("--payload", is_flag=True,
+              help="passes the input columns other than node_id, x, y, z"
+                   " through to the output")
+@click.option('-l', "--limit", type=click.IntRange(1), default=None,
+              help="spiralsorts only the first LIMIT nodes, distance-sorting"
+                   " only the nearest slices needed to reach them")
+@click.option('-s', "--sectors", type=click.IntRange(2), default=None,
+              help="sorts the slices beyond the first million nodes in"
+                   " that many angular sectors each, at worker processes,"
+                   " stitched counterclockwise (numpy engine)")
+@click.option("--compare", is_flag=True,
+              help="at the sectors mode, also spiralsorts sequentially and"
+                   " prints how far the sectors order is from that")
+@click.option('-m', "--out-of-core", is_flag=True,
+              help="streams a csv point-cloud through memory-mapped work"
+                   " files, for point-clouds larger than the memory")
+@click.option("--work-dir", type=click.Path(file_okay=False), default=None,
+              help="where the out-of-core work files are kept"
+                   "  [default: the system's temp dir]")
+@click.option("--stats", "stats_file", type=click.Path(dir_okay=False),
+              default=None,
+              help="writes the phase durations, counters and peak memory of"
+                   " the run into a json file and prints a summary")
+@click.option("--profile", is_flag=True,
+              help="profiles the run into <file>_profile.pstats (cProfile)"
+                   " and <file>_profile.folded (collapsed stacks, for flame"
+                   " graphs) and prints the top functions of core")
+@click.option("--warmup", is_flag=True,
+              help="compiles the numba kernels into the cache and exits"
+                   " (e.g. while building an image)")
+@click.option("--cache-dir", type=click.Path(file_okay=False),
+              envvar="NUMBA_CACHE_DIR", default=None,
+              help="where the compiled numba kernels are cached"
+                   "  [default: $NUMBA_CACHE_DIR, else next to the"
+                   " sources]")
 @click.version_option(version=__import__('spiralsort').__version__,
                       prog_name=__import__('spiralsort').__name__,
                       message='%(version)s')
@@ -34,16 +170,111 @@ from spiralsort.utils import time_this
 def main(file_path,
          start_node_id,
          output_format,
-         save_animation):
-    nodes = io.read_data_file(file_path)
+         save_animation,
+         engine,
+         window_selection,
+         threads,
+         batch,
+         processes,
+         payload,
+         limit,
+         sectors,
+         compare,
+         out_of_core,
+         work_dir,
+         stats_file,
+         profile,
+         warmup,
+         cache_dir):
+    # the startup of main, up to the kernels being loaded (the interpreter
+    # and the imports of this module are timed by bench_import.py)
+    start = timer()
+    if not warmup:
+        _check_usage(file_path, start_node_id, save_animation, batch,
+                     payload, limit, sectors, out_of_core, stats_file,
+                     profile, engine, compare, window_selection,
+                     output_format)
+    engine = engine or "pandas"
+    core = _load_kernels(cache_dir)
+    utils.print_duration(start, timer(), "startup")
+    if warmup:
+        _warmup(core)
+        return
+
+    import numba as nb
+    import pandas as pd
+    from spiralsort import io, profiling, stats
 
-    # When chained_assignment occurs, raise an error, in order to have
-    # full control of the process.
-    with pd.option_context("mode.chained_assignment", "raise"):
-        sorted_nodes = spiralsorted(nodes, start_node_id)
+    if batch:
+        if start_node_id is None:
+            jobs = io.read_manifest(file_path)
+        else:
+            jobs = [(path, start_node_id)
+                    for path in sorted(glob.glob(file_path))]
+        results = []
+        for result in core.spiralsorted_many(jobs, output_format, engine,
+                                             window_selection, processes,
+                                             threads, payload, limit):
+            click.echo(f"{len(results) + 1}/{len(jobs)} {result.file_path}"
+                       + (" failed" if result.error else ""))
+            results.append(result)
+        utils.print_jobs_summary(results)
+        return
+
+    if threads is not None:
+        nb.set_num_threads(threads)
 
     output_file = io.output_file_path(file_path, output_format)
-    io.write_output(sorted_nodes, output_file)
+    profile_files = (io.profile_name(file_path, ".pstats"),
+                     io.profile_name(file_path, ".folded"))
+    # the instrumentation and the profile of this thread (the workers of
+    # the sectors mode and of the prefetching are not recorded)
+    with stats.collecting() if stats_file else nullcontext() as collected, \
+            profiling.profiled(*profile_files) if profile else nullcontext():
+        if out_of_core:
+            from spiralsort import external
+            external.spiralsorted_file(file_path, start_node_id,
+                                       output_file, window_selection,
+                                       work_dir)
+        else:
+            with stats.phase("read"):
+                nodes = io.read_data_file(file_path, payload)
+
+            # When chained_assignment occurs, raise an error, in order to
+            # have full control of the process.
+            with pd.option_context("mode.chained_assignment", "raise"):
+                if sectors:
+                    order = core.spiralsorted_sectors(
+                        nodes, start_node_id, sectors,
+                        window_selection=window_selection,
+                        processes=processes, return_order=True)
+                    sorted_nodes = nodes.iloc[order].reset_index(drop=True)
+                    utils.print_quality(core.spiral_quality(nodes, order))
+                    if compare:
+                        utils.print_difference(core.spiral_difference(
+                            nodes, order,
+                            core.spiralsorted(
+                                nodes, start_node_id, engine="numpy",
+                                window_selection=window_selection,
+                                return_order=True)
+                        ))
+                else:
+                    sorted_nodes = core.spiralsorted(
+                        nodes, start_node_id, engine=engine,
+                        window_selection=window_selection, limit=limit)
+
+            with stats.phase("write"):
+                io.write_output(sorted_nodes, output_file, threads)
+    if stats_file:
+        stats.to_json(collected, stats_file)
+        utils.print_stats(collected)
+    if profile:
+        click.echo(f"Profile written to {profile_files[0]} and"
+                   f" {profile_files[1]}")
+        utils.print_top_functions(
+            profiling.top_functions(profile_files[0], core))
+    if out_of_core:
+        return
 
     if save_animation:
         try:
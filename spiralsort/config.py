@@ -19,5 +19,23 @@ CONST_WINDOW = 32000
 SPIRAL_WINDOW = 400
 STRIDE = 15
 
+# spiral windows of at least that many nodes are searched in parallel
+PARALLEL_WINDOW = 16384
+
+# used by the voxel grid of the spiral_window selection
+GRID_NODES_PER_CELL = 8
+GRID_BLOCK = 8
+
+# nodes per chunk of the out-of-core mode (bounds its memory use)
+EXTERNAL_CHUNK = 1000000
+
+# nodes per csv chunk, formatted (and compressed) at a time
+WRITE_CHUNK = 250000
+
+# the sector-parallel mode sorts the slices beyond that many nodes in
+# SECTORS angular sectors each
+SECTOR_FROM = 1000000
+SECTORS = 8
+
 # used at creating a mock point-cloud
 NUM_NODES = 7000
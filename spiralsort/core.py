@@ -11,14 +11,47 @@
 # ======================================================================
 """Usually does some spiralsorting stuff."""
 
+from collections import deque, namedtuple
+from concurrent.futures import (as_completed, ProcessPoolExecutor,
+                                ThreadPoolExecutor)
+from contextlib import nullcontext
+import multiprocessing
+import sys
+from timeit import default_timer as timer
+
 import numba as nb
 import numpy as np
 import pandas as pd
 
-from spiralsort import utils
+from spiralsort import config, io, shared, spatial, stats, utils
 from spiralsort.utils import time_this
 
 
+ENGINES = ("pandas", "numpy")
+WINDOW_SELECTIONS = {"pandas": ("sort", "partition"),
+                     "numpy": ("sort", "partition", "grid")}
+
+# the outcome of a spiralsorted_many job
+JobResult = namedtuple(
+    "JobResult",
+    ["file_path", "start_node_id", "output_file", "num_nodes", "duration",
+     "error"]
+)
+
+# how spiral-like an order of the point-cloud is (see spiral_quality)
+SpiralQuality = namedtuple(
+    "SpiralQuality",
+    ["path_length", "max_step", "counterclockwise"]
+)
+
+# how far an order is from a reference order (see spiral_difference)
+SpiralDifference = namedtuple(
+    "SpiralDifference",
+    ["path_length", "max_step", "counterclockwise", "mean_rank_shift",
+     "max_rank_shift"]
+)
+
+
 def _start_offset(nodes, start_node_id):
     """offsets all nodes, so that start_node becomes the origin"""
     nodes = nodes.copy()
@@ -106,10 +139,12 @@ def _z_rotation_numpy_y(theta, nodes_x, nodes_y):
     return rotated_y
 
 
-def _z_rotation(nodes, prev_node):
+def _z_rotation(nodes, prev_node):  # pragma: no cover
     """2D rotation on z axis (linear transformation), such as prev_node
     will fall on the 0x axis
 
+    **Deprecated** (the counterclockwise filter compares angles)
+
     transformation matrix:
 
         | cos(theta)  sin(theta)|
@@ -132,14 +167,36 @@ def _z_rotation(nodes, prev_node):
     return rotated
 
 
+@nb.njit(nb.f4[:](nb.f4[:], nb.f4[:]), cache=True, nogil=True)
+def _xy_angle_numpy(nodes_x, nodes_y):
+    """returns the angles of the node vectors from the 0x axis
+
+    They are fixed after _start_offset, so they are evaluated once, and
+    the counterclockwise filter only compares them.
+    """
+    theta = np.arctan2(nodes_y, nodes_x)
+    return theta
+
+
+def _counterclockwise_mask(nodes_theta, prev_theta):
+    """whether the angles nodes_theta lie at the counterclockwise side
+    of prev_theta, at [prev_theta, prev_theta + pi] (modulo 2pi)
+
+    Equivalent to rotating the nodes by -prev_theta and keeping the
+    ones with rotated y >= 0.
+    """
+    d_theta = nodes_theta - prev_theta
+    return ((d_theta >= 0) & (d_theta <= np.pi)) | (d_theta <= -np.pi)
+
+
 def _counterclockwise_filter(nodes, prev_node):
     """keeps only nodes from the counterclockwise side of the vector
     that starts at the start_node and ends at prev_node
 
     The goal is to force the algorithm to spiral counter-clockwise. This
-    is achieved by rotating the cloud, so that the vector of prev_node
-    falls on the (positive side of) x axis, and keeping only the nodes
-    with positive y.
+    is achieved by keeping the nodes whose angle from the x axis lies
+    at [theta, theta + pi], where theta is the angle of prev_node. The
+    angles are read from the "theta" column, if there is one.
 
     Args:
         nodes (df)     :  the point-cloud
@@ -148,14 +205,23 @@ def _counterclockwise_filter(nodes, prev_node):
     Returns:
         (index)        :  the indexes of the filtered nodes
     """
-    nodes_rotated = _z_rotation(nodes, prev_node)
-    nodes_filtered_index = nodes_rotated[nodes_rotated.y >= 0].index
+    if "theta" in nodes:
+        nodes_theta = nodes["theta"].values
+    else:
+        nodes_theta = np.arctan2(nodes.y.values, nodes.x.values)
+    if "theta" in prev_node:
+        prev_theta = prev_node["theta"]
+    else:
+        prev_theta = np.arctan2(prev_node.y, prev_node.x)
+    nodes_filtered_index = \
+        nodes.index[_counterclockwise_mask(nodes_theta, prev_theta)]
 
     # don't counterclockwise filter if prev_node is the start_node
     # or no nodes are left after the filter
     if len(nodes_filtered_index):
         return nodes_filtered_index
     else:
+        stats.count("filter_fallbacks")
         return nodes.index
 
 
@@ -196,12 +262,64 @@ def _cost_sort(nodes, prev_node, ignore_index=True):
     return nodes
 
 
+def _argselect(cost, k):
+    """positions of the k smallest costs, cost-sorted
+
+    Equivalent to the first k of a stable (mergesort) argsort, but only
+    the k winners are sorted, after an O(n) partition.
+
+    Args:
+        cost (array)
+        k (int)
+
+    Returns:
+        winners (array)
+    """
+    if k >= len(cost):
+        return np.argsort(cost, kind="mergesort")
+    kth_cost = np.partition(cost, k - 1)[k - 1]
+    winners = np.flatnonzero(cost <= kth_cost)
+
+    # keep the first of the nodes that tie with the k-th, as a stable
+    # sort would
+    if len(winners) > k:
+        cheaper = cost[winners] < kth_cost
+        ties_kept = k - np.count_nonzero(cheaper)
+        winners = winners[cheaper | (np.cumsum(~cheaper) <= ties_kept)]
+    return winners[np.argsort(cost[winners], kind="mergesort")]
+
+
+def _cost_select(nodes, prev_node, spiral_window):
+    """selects the spiral_window nodes with the lowest cost from
+    prev_node, cost-sorted
+
+    The partial counterpart of _cost_sort. nodes are left untouched and
+    ties keep the order of nodes.
+
+    Args:
+        nodes (df)          : the point-cloud
+        prev_node (df)      : the node from which to calculate the cost
+        spiral_window (int) : the number of nodes to select
+
+    Returns:
+        nodes_selected (df) : the selected nodes, cost-sorted
+    """
+    cost = _cost(nodes, prev_node)
+    winners = _argselect(cost.values, spiral_window)
+    nodes_selected = nodes.iloc[winners].copy()
+    nodes_selected["cost"] = cost.values[winners]
+    return nodes_selected.reset_index(drop=True)
+
+
 def _pop_next_node(nodes, prev_node):
     """nodewise step of the algorithm
 
     1. evaluate cost
     2. pop the node with the min cost
 
+    Both steps, together with the counterclockwise filter, run at the
+    fused _next_node_numpy kernel.
+
     Args:
         nodes (df)          : the point-cloud
         prev_node (df)      : the last popped node
@@ -209,18 +327,22 @@ def _pop_next_node(nodes, prev_node):
     Returns:
         nodes (df)          : the point-cloud, without the currently
                               popped node
-        next_node_id (str)  : to be appended to the node_ids list
+        next_node_id (int)  : the code of the popped node, to be appended
+                              to the node_ids list
         next_node (series)  : the currently popped node
     """
-    nodes_filtered = nodes.loc[_counterclockwise_filter(nodes, prev_node)]
-
-    # 1. evaluate cost
-    nodes_filtered.loc[:, "cost"] = _cost(nodes_filtered, prev_node)
-
-    # 2. pop the next_node
-    next_node_idx = nodes_filtered["cost"].idxmin()
-    next_node = nodes_filtered.loc[next_node_idx]
-    next_node_id = next_node.node_id
+    next_pos, fallback = _next_node_numpy(
+        nodes.x.values, nodes.y.values, nodes.z.values,
+        nodes["|node - start|"].values, nodes["theta"].values,
+        np.arange(len(nodes.index)), np.ones(len(nodes.index), dtype=bool),
+        np.float32(prev_node.x), np.float32(prev_node.y),
+        np.float32(prev_node.z), np.float32(prev_node.theta)
+    )
+    if next_pos == -1:
+        stats.count("filter_fallbacks")
+        next_pos = fallback
+    next_node = nodes.iloc[next_pos]
+    next_node_id = nodes["node_id"].values[next_pos]
     nodes = nodes[~nodes.index.isin([next_node.name])]
     return nodes, next_node_id, next_node
 
@@ -229,7 +351,8 @@ def _spiral_stride(nodes,
                    node_ids,
                    prev_node,
                    spiral_window,
-                   stride):
+                   stride,
+                   window_selection="sort"):
     """moves one stride inside the spiral_window, iteretively popping
     nodes with respect to the min cost
 
@@ -242,6 +365,10 @@ def _spiral_stride(nodes,
                                will iteretively search for the next node
         stride (int)        :  the number of nodes to be sorted, before
                                moving to the next spiral_window
+        window_selection (str) : sort cost-sorts all the nodes, partition
+                               cost-selects the spiral_window out of
+                               the counterclockwise filtered nodes
+                               (default sort)
 
     Returns:
         nodes (df)          :  the initially nodes batch, without the
@@ -254,23 +381,40 @@ def _spiral_stride(nodes,
     # keep a temp node_ids list, not to search through the whole list
     node_ids_inner = []
 
-    # for the first 1000 nodes dont filter the counterclockwise side
-    # nodes, to prevent from oscilating on a lobe (half spherical disk)
-    if len(node_ids) <= 1000:
-        nodes_filtered = nodes[slice(0, spiral_window)]
-    else:
-        nodes_filtered = nodes.loc[_counterclockwise_filter(nodes, prev_node)]
-        nodes_filtered = _cost_sort(nodes, prev_node)
-        nodes_filtered = nodes_filtered[slice(0, spiral_window)]
+    with stats.phase("window"):
+        # for the first 1000 nodes dont filter the counterclockwise side
+        # nodes, to prevent from oscilating on a lobe (half spherical
+        # disk)
+        if len(node_ids) <= 1000:
+            nodes_filtered = nodes[slice(0, spiral_window)]
+        elif window_selection == "partition":
+            # (no fallback here, as in _select_window: an empty filter
+            # falls back below, too)
+            nodes_filtered = nodes[_counterclockwise_mask(
+                nodes["theta"].values, prev_node["theta"])]
+            # each stride has to pop a whole stride, or the remaining
+            # strides will not suffice to pop all the nodes
+            if len(nodes_filtered.index) < stride:
+                stats.count("window_fallbacks")
+                nodes_filtered = nodes
+            nodes_filtered = _cost_select(nodes_filtered, prev_node,
+                                          spiral_window)
+        else:
+            nodes_filtered = _cost_sort(nodes, prev_node)
+            nodes_filtered = nodes_filtered[slice(0, spiral_window)]
 
     iters = min(stride, len(nodes_filtered.index))
-
-    for _ in range(iters):
-        nodes_filtered, prev_node_id, prev_node = _pop_next_node(
-            nodes_filtered,
-            prev_node
-        )
-        node_ids_inner.append(prev_node_id)
+    stats.count("strides")
+    stats.count("pops", iters)
+    stats.sample("window_size", len(nodes_filtered.index))
+
+    with stats.phase("pop"):
+        for _ in range(iters):
+            nodes_filtered, prev_node_id, prev_node = _pop_next_node(
+                nodes_filtered,
+                prev_node
+            )
+            node_ids_inner.append(prev_node_id)
 
     # drop node_ids_inner from nodes remainder
     nodes = nodes[~nodes.node_id.isin(node_ids_inner)]
@@ -281,8 +425,602 @@ def _spiral_stride(nodes,
     return nodes, node_ids, prev_node
 
 
+def _start_row(nodes_input, start_node_id):
+    """the input row of the start_node"""
+    start_rows = np.flatnonzero(nodes_input["node_id"].values == start_node_id)
+    if not len(start_rows):
+        raise ValueError(f"start_node_id {start_node_id} not found")
+    return start_rows[0]
+
+
+def _node_arrays(nodes_input):
+    """the x, y, z columns of the point-cloud, as float32 arrays"""
+    return tuple(nodes_input[axis].to_numpy(np.float32)
+                 for axis in ('x', 'y', 'z'))
+
+
+def _radial_select(d_start, num_nearest):
+    """the positions of the num_nearest smallest distances, in ascending
+    order of position
+
+    A partial selection, instead of a full sort; distance ties at the
+    boundary are broken by position, so that the stable distance-sort of
+    the selected nodes is the head of the stable distance-sort of all.
+    """
+    kth = np.partition(d_start, num_nearest - 1)[num_nearest - 1]
+    nearest = np.flatnonzero(d_start < kth)
+    ties = np.flatnonzero(d_start == kth)[:num_nearest - len(nearest)]
+    return np.union1d(nearest, ties)
+
+
+def _limit_slices(num_nodes, limit=None):
+    """the slices of a point-cloud, and the number of nodes nearest to the
+    start_node that have to be distance-sorted, to pop the first limit
+    nodes
+
+    A slice that is not the last one leaves less than half_slice + STRIDE
+    nodes unpopped, so the slices up to the first one that leaves at
+    least limit nodes popped suffice.
+
+    Args:
+        num_nodes (int)    :  the nodes of the point-cloud, but the
+                              start_node
+        limit (int)        :  the nodes to be spiralsorted, including the
+                              start_node (default None, all of them)
+
+    Returns:
+        slices (list)      :  the slices of the whole point-cloud
+        num_nearest (int)
+    """
+    slices = utils.create_slices(range(num_nodes))
+    if limit is None:
+        return slices, num_nodes
+    for idx, slicing_obj in enumerate(slices):
+        num_popped = slicing_obj.stop - utils.calc_half_slice(slicing_obj) \
+            - config.STRIDE + 1
+        if (num_popped >= limit) or (idx == len(slices) - 1):
+            return slices, min(slicing_obj.stop, num_nodes)
+
+
+def _radial_sort_arrays(nodes_xyz, start_row, num_nearest=None):
+    """_radial_sort_numpy, on the float32 x, y, z arrays of the
+    point-cloud (which are left untouched)
+    """
+    # make start_node the origin of the axes
+    x, y, z = (axis - axis[start_row] for axis in nodes_xyz)
+
+    # drop start node
+    rows = np.delete(np.arange(len(x)), start_row)
+
+    # distance-sort from start_node (same stable sort as the df path)
+    d_start = _distances_from_node_numpy(x[rows], y[rows], z[rows],
+                                         x[start_row], y[start_row],
+                                         z[start_row])
+    if (num_nearest is not None) and (num_nearest < len(rows)):
+        selected = _radial_select(d_start, num_nearest)
+        rows, d_start = rows[selected], d_start[selected]
+    order = np.argsort(d_start, kind="mergesort")
+    rows = rows[order]
+    x = np.ascontiguousarray(x[rows])
+    y = np.ascontiguousarray(y[rows])
+    cloud = (x, y, np.ascontiguousarray(z[rows]), d_start[order],
+             _xy_angle_numpy(x, y))
+    return rows, cloud
+
+
+def _radial_sort_lazy(nodes_xyz, start_row):
+    """_radial_sort_arrays, distance-sorting the nodes only as far as the
+    slices being worked on need
+
+    rows and the cloud are allocated whole, but filled in by
+    prepare_slice, which distance-sorts the nodes up to the stop of a
+    slice, by a partial selection of the unsorted nodes. Each selection
+    takes at least as many nodes as the ones already sorted, so that the
+    point-cloud is partitioned a logarithmic number of times.
+
+    Returns:
+        rows (array)             :  see _radial_sort_numpy
+        cloud (tuple)            :  see _radial_sort_numpy
+        prepare_slice (callable) :  fills in rows and the cloud up to the
+                                    stop of a slice
+    """
+    # make start_node the origin of the axes
+    x, y, z = (axis - axis[start_row] for axis in nodes_xyz)
+
+    # drop start node
+    others = np.delete(np.arange(len(x)), start_row)
+    d_others = _distances_from_node_numpy(x[others], y[others], z[others],
+                                          x[start_row], y[start_row],
+                                          z[start_row])
+    rows = np.empty(len(others), dtype=np.int64)
+    cloud = tuple(np.empty(len(others), dtype=np.float32) for _ in range(5))
+    unsorted = np.arange(len(others))
+    num_sorted = 0
+
+    def prepare_slice(slicing_obj):
+        nonlocal unsorted, num_sorted
+        stop = min(slicing_obj.stop, len(others))
+        if stop <= num_sorted:
+            return
+        num_nearest = max(stop, 2 * num_sorted) - num_sorted
+        if num_nearest < len(unsorted):
+            # in ascending position, as unsorted, so that the ties are
+            # broken as in the stable distance-sort of all the nodes
+            selected = unsorted[_radial_select(d_others[unsorted],
+                                               num_nearest)]
+            taken = np.zeros(len(others), dtype=np.bool_)
+            taken[selected] = True
+            unsorted = unsorted[~taken[unsorted]]
+        else:
+            selected, unsorted = unsorted, unsorted[:0]
+        selected = selected[np.argsort(d_others[selected], kind="mergesort")]
+        sorted_slice = slice(num_sorted, num_sorted + len(selected))
+        rows[sorted_slice] = others[selected]
+        cloud[0][sorted_slice] = x[rows[sorted_slice]]
+        cloud[1][sorted_slice] = y[rows[sorted_slice]]
+        cloud[2][sorted_slice] = z[rows[sorted_slice]]
+        cloud[3][sorted_slice] = d_others[selected]
+        cloud[4][sorted_slice] = _xy_angle_numpy(cloud[0][sorted_slice],
+                                                 cloud[1][sorted_slice])
+        num_sorted = sorted_slice.stop
+
+    return rows, cloud, prepare_slice
+
+
+def _radial_sort_numpy(nodes_input, start_node_id, num_nearest=None):
+    """array counterpart of _start_offset and the distance-sort from the
+    start_node
+
+    Args:
+        nodes_input (df)     :  the point-cloud
+        start_node_id (str)  :  the node where spiralsorting starts
+        num_nearest (int)    :  keep only that many nodes nearest to the
+                                start_node (default None, all of them)
+
+    Returns:
+        start_row (int)      :  the input row of the start_node
+        rows (array)         :  the input rows of the rest of the nodes,
+                                distance-sorted from the start_node
+        cloud (tuple)        :  the contiguous float32 x, y, z arrays,
+                                offset to the start_node, the
+                                |node - start| array and the angles of
+                                the nodes from the 0x axis, all in the
+                                order of rows
+    """
+    start_row = _start_row(nodes_input, start_node_id)
+    rows, cloud = _radial_sort_arrays(_node_arrays(nodes_input), start_row,
+                                      num_nearest)
+    return start_row, rows, cloud
+
+
+@nb.njit(nb.types.UniTuple(nb.i8, 2)(nb.f4[:], nb.f4[:], nb.f4[:],
+                                     nb.f4[:], nb.f4[:], nb.i8[:],
+                                     nb.b1[:], nb.f4, nb.f4, nb.f4, nb.f4,
+                                     nb.i8, nb.i8),
+         cache=True, nogil=True)
+def _argmin_range_numpy(nodes_x, nodes_y, nodes_z, nodes_d, nodes_theta,
+                        window, live, prev_x, prev_y, prev_z, prev_theta,
+                        begin, end):
+    """the min cost nodes of window[begin:end], with and without the
+    counterclockwise filter
+
+    Returns:
+        (tuple)  :  the window positions of the min cost counterclockwise
+                    node and of the min cost node out of the rest (-1 if
+                    there is none), the first of them at ties
+    """
+    pi = np.float32(np.pi)
+    best = -1
+    best_cost = np.float32(0)
+    fallback = -1
+    fallback_cost = np.float32(0)
+    for i in range(begin, end):
+        if not live[i]:
+            continue
+        j = window[i]
+        dx = nodes_x[j] - prev_x
+        dy = nodes_y[j] - prev_y
+        dz = nodes_z[j] - prev_z
+        cost = nodes_d[j] + np.sqrt(dx * dx + dy * dy + dz * dz)
+        d_theta = nodes_theta[j] - prev_theta
+        if ((d_theta >= 0) and (d_theta <= pi)) or (d_theta <= -pi):
+            if (best == -1) or (cost < best_cost):
+                best = i
+                best_cost = cost
+        elif (fallback == -1) or (cost < fallback_cost):
+            fallback = i
+            fallback_cost = cost
+    return best, fallback
+
+
+@nb.njit(nb.types.UniTuple(nb.i8, 2)(nb.f4[:], nb.f4[:], nb.f4[:],
+                                     nb.f4[:], nb.f4[:], nb.i8[:],
+                                     nb.b1[:], nb.f4, nb.f4, nb.f4, nb.f4),
+         cache=True, nogil=True)
+def _next_node_numpy(nodes_x, nodes_y, nodes_z, nodes_d, nodes_theta,
+                     window, live, prev_x, prev_y, prev_z, prev_theta):
+    """fused counterclockwise filter, cost and argmin
+
+    A single pass over the live window nodes, without any intermediate
+    arrays. The counterclockwise filter falls back to all the live
+    nodes, when no node survives it; the caller pops the fallback node
+    when best is -1 (and counts the fallback).
+
+    Args:
+        nodes_x, nodes_y, nodes_z (array) :  the point-cloud
+        nodes_d (array)                   :  |node - start|
+        nodes_theta (array)               :  the angles of the nodes
+                                             from the 0x axis
+        window (array)                    :  the positions of the
+                                             spiral_window nodes
+        live (array)                      :  the live mask of the window
+        prev_x, prev_y, prev_z (float)    :  the last popped node
+        prev_theta (float)                :  its angle from the 0x axis
+
+    Returns:
+        best (int)                        :  the window position of the
+                                             min cost counterclockwise
+                                             node (-1 if there is none)
+        fallback (int)                    :  the window position of the
+                                             min cost node out of the
+                                             rest, when best is -1 (-1 if
+                                             no node is live)
+    """
+    return _argmin_range_numpy(
+        nodes_x, nodes_y, nodes_z, nodes_d, nodes_theta, window, live,
+        prev_x, prev_y, prev_z, prev_theta, 0, len(window)
+    )
+
+
+@nb.njit(nb.types.UniTuple(nb.i8, 2)(nb.f4[:], nb.f4[:], nb.f4[:],
+                                     nb.f4[:], nb.f4[:], nb.i8[:],
+                                     nb.b1[:], nb.f4, nb.f4, nb.f4, nb.f4),
+         cache=True, nogil=True, parallel=True)
+def _next_node_parallel_numpy(nodes_x, nodes_y, nodes_z, nodes_d,
+                              nodes_theta, window, live,
+                              prev_x, prev_y, prev_z, prev_theta):
+    """_next_node_numpy, with the window split into chunks that are
+    searched in parallel
+
+    The chunk minima are reduced in order, so that ties resolve as in
+    the serial kernel.
+    """
+    chunk_size = 2048
+    num_chunks = - (-len(window) // chunk_size)
+    bests = np.empty(num_chunks, dtype=np.int64)
+    fallbacks = np.empty(num_chunks, dtype=np.int64)
+    for c in nb.prange(num_chunks):
+        best, fallback = _argmin_range_numpy(
+            nodes_x, nodes_y, nodes_z, nodes_d, nodes_theta, window, live,
+            prev_x, prev_y, prev_z, prev_theta,
+            min(c * chunk_size, len(window)),
+            min((c + 1) * chunk_size, len(window))
+        )
+        bests[c] = best
+        fallbacks[c] = fallback
+
+    # the costs of the few chunk winners are evaluated again at reduction
+    winners = np.full(2, -1, dtype=np.int64)
+    for k, candidates in enumerate((bests, fallbacks)):
+        winner_cost = np.float32(0)
+        for i in candidates:
+            if i == -1:
+                continue
+            j = window[i]
+            dx = nodes_x[j] - prev_x
+            dy = nodes_y[j] - prev_y
+            dz = nodes_z[j] - prev_z
+            cost = nodes_d[j] + np.sqrt(dx * dx + dy * dy + dz * dz)
+            if (winners[k] == -1) or (cost < winner_cost):
+                winners[k] = i
+                winner_cost = cost
+        if winners[k] != -1:
+            break
+    return winners[0], winners[1]
+
+
+@nb.njit(nb.types.Tuple((nb.i8[:], nb.i8))(nb.f4[:], nb.f4[:], nb.f4[:],
+                                           nb.f4[:], nb.f4[:], nb.i8[:],
+                                           nb.f4, nb.f4, nb.f4, nb.f4,
+                                           nb.i8, nb.b1),
+         cache=True, nogil=True)
+def _pop_stride_numpy(nodes_x, nodes_y, nodes_z, nodes_d, nodes_theta,
+                      window, prev_x, prev_y, prev_z, prev_theta, stride,
+                      parallel):
+    """numba kernel of a whole stride (the popping loop of _spiral_stride
+    together with _pop_next_node)
+
+    Each pop is a single pass of the fused _next_node_numpy kernel over
+    the window, so only the popped nodes return to python. Popped nodes
+    are switched off at a live mask, instead of building a new container
+    at each pop.
+
+    Args:
+        nodes_x, nodes_y, nodes_z (array) :  the point-cloud
+        nodes_d (array)                   :  |node - start|
+        nodes_theta (array)               :  the angles of the nodes
+                                             from the 0x axis
+        window (array)                    :  the positions of the
+                                             spiral_window nodes
+        prev_x, prev_y, prev_z (float)    :  the last popped node
+        prev_theta (float)                :  its angle from the 0x axis
+        stride (int)                      :  the number of nodes to be
+                                             popped
+        parallel (bool)                   :  whether to use the prange
+                                             kernel, for large windows
+
+    Returns:
+        popped (array)                    :  the positions of the popped
+                                             nodes
+        num_fallbacks (int)               :  the pops that fell back to
+                                             the non counterclockwise
+                                             nodes
+    """
+    live = np.ones(len(window), dtype=np.bool_)
+    popped = np.empty(min(stride, len(window)), dtype=np.int64)
+    num_fallbacks = 0
+
+    for i in range(len(popped)):
+        if parallel:
+            next_idx, fallback = _next_node_parallel_numpy(
+                nodes_x, nodes_y, nodes_z, nodes_d, nodes_theta, window,
+                live, prev_x, prev_y, prev_z, prev_theta
+            )
+        else:
+            next_idx, fallback = _next_node_numpy(
+                nodes_x, nodes_y, nodes_z, nodes_d, nodes_theta, window,
+                live, prev_x, prev_y, prev_z, prev_theta
+            )
+        if next_idx == -1:
+            next_idx = fallback
+            num_fallbacks += 1
+        live[next_idx] = False
+        popped[i] = window[next_idx]
+        prev_x = nodes_x[popped[i]]
+        prev_y = nodes_y[popped[i]]
+        prev_z = nodes_z[popped[i]]
+        prev_theta = nodes_theta[popped[i]]
+    return popped, num_fallbacks
+
+
+def _num_strides(num_remaining, slicing_obj, last_slice):
+    """the strides of a slice, that leave a half slice of nodes to be
+    merged with the next one (none for the last slice)
+    """
+    if not last_slice:
+        half_slice = utils.calc_half_slice(slicing_obj)
+        return (num_remaining - half_slice) // config.STRIDE
+    return - (-num_remaining // config.STRIDE)
+
+
+def _select_window(cloud, remaining, prev_xyz, prev_theta, spiral_window,
+                   window_selection):
+    """the spiral_window of the sort and partition window_selections, once
+    the first 1000 nodes are sorted
+
+    Args:
+        cloud (tuple)           :  x, y, z, |node - start|, theta
+        remaining (array)       :  the positions of the remaining nodes
+        prev_xyz (tuple)        :  the last popped node
+        prev_theta (float)      :  its angle from the 0x axis
+        spiral_window (int)     :  the number of nodes to select
+        window_selection (str)  :  sort or partition
+
+    Returns:
+        window (array)          :  the positions of the spiral_window
+        remaining (array)       :  cost-sorted (sort) or untouched
+                                   (partition)
+    """
+    x, y, z, d_start, theta = cloud
+    if window_selection == "partition":
+        filtered = remaining[_counterclockwise_mask(theta[remaining],
+                                                    prev_theta)]
+        if len(filtered) < config.STRIDE:
+            stats.count("window_fallbacks")
+            filtered = remaining
+        cost = d_start[filtered] + _distances_from_node_numpy(
+            x[filtered], y[filtered], z[filtered], *prev_xyz)
+        return filtered[_argselect(cost, spiral_window)], remaining
+    cost = d_start[remaining] + _distances_from_node_numpy(
+        x[remaining], y[remaining], z[remaining], *prev_xyz)
+    remaining = remaining[np.argsort(cost, kind="mergesort")]
+    return remaining[:spiral_window], remaining
+
+
+def _spiral_strides_numpy(cloud, slices, window_selection="sort",
+                          prepare_slice=None):
+    """array counterpart of the slice loop of spiralsorted
+
+    The nodes are referred to by their position at the distance-sorted
+    cloud, and popped nodes are switched off at a live mask over the
+    whole cloud.
+
+    window_selection:
+    - sort: remaining holds the positions that the algorithm is working
+            on, in the same order as the remaining_nodes df, cost-sorting
+            it before each stride (as the pandas path does)
+    - partition: the remaining nodes are counterclockwise filtered and
+            only the spiral_window cheapest of them are selected and
+            sorted, leaving the order of remaining untouched
+    - grid: a voxel grid is built once over the cloud and each
+            spiral_window is queried around the prev_node, so that a
+            stride costs the same, no matter the size of the slice
+
+    Args:
+        cloud (tuple)           :  x, y, z, |node - start|, theta,
+                                   distance-sorted
+        slices (list)           :  the slices of the distance-sorted cloud
+        window_selection (str)  :  sort, partition or grid (default sort)
+        prepare_slice (callable):  called with each slice, before it is
+                                   worked on, e.g. to fill in the cloud
+                                   (default None)
+
+    Yields:
+        popped (array)          :  the positions of the nodes popped at a
+                                   stride
+    """
+    x, y, z, d_start, theta = cloud
+    alive = np.ones(len(x), dtype=np.bool_)
+    remaining = np.empty(0, dtype=np.int64)
+    if window_selection == "grid":
+        grid = spatial.build_grid(x, y, z)
+
+    # the start node is the origin
+    prev_xyz = (np.float32(0), np.float32(0), np.float32(0))
+    prev_theta = np.float32(0)
+    num_sorted = 1
+
+    for idx, slicing_obj in enumerate(slices):
+        if prepare_slice is not None:
+            prepare_slice(slicing_obj)
+        spiral_window = int(config.SPIRAL_WINDOW + 100 * idx)
+        stop = min(slicing_obj.stop, len(x))
+        if window_selection != "grid":
+            remaining = np.concatenate(
+                [remaining, np.arange(*slicing_obj.indices(len(x)))]
+            )
+        else:
+            spatial.activate(grid, np.arange(*slicing_obj.indices(len(x))))
+        num_remaining = stop - num_sorted + 1
+        strides = _num_strides(num_remaining, slicing_obj,
+                               idx == len(slices) - 1)
+        stats.count("slices")
+        stats.sample("slice_size", num_remaining)
+
+        for _ in range(strides):
+            with stats.phase("window"):
+                if window_selection == "grid":
+                    if num_sorted > 1000:
+                        window = spatial.grid_window(grid, cloud, alive,
+                                                     stop, prev_xyz,
+                                                     spiral_window)
+                    else:
+                        # nothing is cost-sorted yet
+                        window = \
+                            np.flatnonzero(alive[:stop])[:spiral_window]
+                elif num_sorted > 1000:
+                    window, remaining = _select_window(cloud, remaining,
+                                                       prev_xyz, prev_theta,
+                                                       spiral_window,
+                                                       window_selection)
+                else:
+                    window = remaining[:spiral_window]
+
+            with stats.phase("pop"):
+                popped, num_fallbacks = _pop_stride_numpy(
+                    x, y, z, d_start, theta, window, *prev_xyz, prev_theta,
+                    config.STRIDE, len(window) >= config.PARALLEL_WINDOW
+                )
+            stats.count("strides")
+            stats.count("pops", len(popped))
+            stats.count("filter_fallbacks", num_fallbacks)
+            stats.sample("window_size", len(window))
+            if not len(popped):
+                continue
+            prev_xyz = (x[popped[-1]], y[popped[-1]], z[popped[-1]])
+            prev_theta = theta[popped[-1]]
+            alive[popped] = False
+            if window_selection != "grid":
+                remaining = remaining[alive[remaining]]
+            else:
+                spatial.deactivate(grid, popped)
+            num_sorted += len(popped)
+            yield popped
+
+
+def _spiralsorted_numpy(nodes_input,
+                        start_node_id,
+                        window_selection="sort",
+                        limit=None):
+    """spiralsorted, with the nodes held at contiguous arrays
+
+    Returns:
+        order (array)  :  the input rows in the spiralsorted order
+    """
+    slices, num_nearest = _limit_slices(len(nodes_input.index) - 1, limit)
+    with stats.phase("radial"):
+        start_row, rows, cloud = _radial_sort_numpy(nodes_input,
+                                                    start_node_id,
+                                                    num_nearest)
+    return _spiral_order_numpy(start_row, rows, cloud, window_selection,
+                               slices, limit)
+
+
+def _spiral_order_numpy(start_row,
+                        rows,
+                        cloud,
+                        window_selection="sort",
+                        slices=None,
+                        limit=None):
+    """the spiralsorted input rows, out of _radial_sort_numpy
+
+    slices default to the slices of rows. With a limit, the stride loop
+    stops once limit nodes are sorted.
+    """
+    if slices is None:
+        slices = utils.create_slices(rows)
+    popped = []
+    num_sorted = 1
+    with stats.phase("strides"):
+        for popped_stride in _spiral_strides_numpy(cloud, slices,
+                                                   window_selection):
+            popped.append(popped_stride)
+            num_sorted += len(popped_stride)
+            if (limit is not None) and (num_sorted >= limit):
+                break
+    order = np.concatenate([[start_row], rows[np.concatenate(popped)]]) \
+        if popped else np.array([start_row])
+    return order[:limit]
+
+
+def _take_rows(nodes_input, order):
+    """the point-cloud reordered by a single gather per column
+
+    The payload columns (any columns other than node_id, x, y, z) follow
+    the node columns, gathered as they are (arrow-backed columns are
+    gathered at arrow).
+    """
+    columns = io.NODE_COLUMNS + [column for column in nodes_input.columns
+                                 if column not in io.NODE_COLUMNS]
+    return pd.DataFrame({column: nodes_input[column].values.take(order)
+                         for column in columns})
+
+
+def _prefetched(prepare, items):
+    """yields prepare(item) for each of the items, preparing the next
+    item at a background thread, while the current one is consumed
+
+    prepare should mostly run in numpy or numba (nogil) code, for the
+    two threads to overlap.
+    """
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        pending = deque()
+        for item in items:
+            pending.append(pool.submit(prepare, item))
+            if len(pending) > 1:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def _check_engine(engine, window_selection):
+    """raises a ValueError on unknown engine or window_selection"""
+    if engine not in ENGINES:
+        raise ValueError(f"engine should be one of {ENGINES}, not {engine}")
+    if window_selection not in WINDOW_SELECTIONS[engine]:
+        raise ValueError(f"window_selection should be one of"
+                         f" {WINDOW_SELECTIONS[engine]} for the {engine}"
+                         f" engine, not {window_selection}")
+
+
 @time_this
-def spiralsorted(nodes_input, start_node_id):
+def spiralsorted(nodes_input,
+                 start_node_id,
+                 engine="pandas",
+                 window_selection="sort",
+                 return_order=False,
+                 limit=None,
+                 return_stats=False):
     """SpiralSorts the point-cloud, starting from the start_node.
 
     The SpiralSort algorithm:
@@ -320,90 +1058,631 @@ def spiralsorted(nodes_input, start_node_id):
     10. Upon reaching the last slice, remove the *half_slice* threshold,
        to pop all the remaining nodes.
 
+    Only x, y, z go into the engine. Any columns other than node_id, x,
+    y, z are payload, passed through to the output untouched.
+
     Args:
-        nodes (df)           :  the point-cloud
-        start_node_id (str)  :  the node where spiralsorting starts
+        nodes (df)              :  the point-cloud
+        start_node_id (str)     :  the node where spiralsorting starts
+        engine (str)            :  "pandas" works on the df, "numpy"
+                                   works on contiguous float32 arrays,
+                                   never building a df inside the loop.
+                                   Both return the same order.
+                                   (default pandas)
+        window_selection (str)  :  how the spiral_window is selected:
+                                   "sort" cost-sorts the remaining
+                                   nodes, "partition" cost-selects only
+                                   the spiral_window cheapest of the
+                                   counterclockwise filtered nodes,
+                                   "grid" queries a voxel grid around
+                                   the prev_node (numpy engine only;
+                                   same order as sort, but for exact
+                                   cost ties) (default sort)
+        return_order (bool)     :  return the permutation of the input
+                                   rows, instead of the reordered
+                                   point-cloud (default False)
+        limit (int)             :  spiralsort only the first limit nodes
+                                   (start_node included); only the
+                                   nearest slices needed to reach them
+                                   are distance-sorted, after a partial
+                                   selection (default None, all nodes)
+        return_stats (bool)     :  also return the Stats of the run:
+                                   the durations of its phases, its
+                                   counters and samples and the peak
+                                   memory (see spiralsort.stats)
+                                   (default False)
 
     Returns:
-        nodes_sorted (df)    :  the spiralsorted point-cloud
+        nodes_sorted (df)       :  the spiralsorted point-cloud, or
+        order (array)           :  the input rows in the spiralsorted
+                                   order (int64), if return_order
+        stats (Stats)           :  if return_stats
     """
-    # first, check if the node_ids are unique
-    utils.check_duplicated_ids(nodes_input)
+    _check_engine(engine, window_selection)
+    if (limit is not None) and (limit < 1):
+        raise ValueError(f"limit should be at least 1, not {limit}")
+
+    with stats.collecting() if return_stats else nullcontext() \
+            as collected:
+        # first, check if the node_ids are unique
+        with stats.phase("check_ids"):
+            utils.check_duplicated_ids(nodes_input)
+
+        if engine == "numpy":
+            order = _spiralsorted_numpy(nodes_input, start_node_id,
+                                        window_selection, limit)
+        else:
+            order = _spiralsorted_pandas(nodes_input, start_node_id,
+                                         window_selection, limit)
+        if not return_order:
+            with stats.phase("reorder"):
+                nodes_sorted = _take_rows(nodes_input, order)
+    result = order if return_order else nodes_sorted
+    return (result, collected) if return_stats else result
+
+
+def _spiralsorted_pandas(nodes_input,
+                         start_node_id,
+                         window_selection="sort",
+                         limit=None):
+    """spiralsorted, with the nodes held at a df (see spiralsorted for the
+    algorithm)
 
-    # final sequence of ids, used to sort the final dataframe,
+    Returns:
+        order (array)  :  the input rows in the spiralsorted order
+    """
+    # The node_ids are unique, so their int32 codes are the input rows.
+    # The start_node_id is resolved to its code once, here, the loop
+    # works on the codes only and the node_ids are restored at the
+    # output.
+    start_code = _start_row(nodes_input, start_node_id)
+    nodes = nodes_input.loc[:, ['x', 'y', 'z']]
+    nodes.insert(0, "node_id",
+                 np.arange(len(nodes.index), dtype=np.int32))
+
+    # final sequence of codes, used to sort the final dataframe,
     # initialized with the start node
-    node_ids = [start_node_id]
+    node_ids = [start_code]
+
+    with stats.phase("radial"):
+        # make start_node the origin of the axes
+        nodes = _start_offset(nodes, start_code)
+
+        # angle of all nodes from the 0x axis (0 for the start_node)
+        nodes["theta"] = _xy_angle_numpy(nodes.x.values, nodes.y.values)
+
+        # initialize previous node with the start node (series)
+        start_node = nodes.loc[nodes["node_id"] == start_code]
+        prev_node = start_node.iloc[0]
+
+        # drop start node
+        nodes.drop(start_node.index, inplace=True)
+
+        # distance of all nodes from the start node
+        nodes["|node - start|"] = _distances_from_node(nodes, prev_node)
+
+        # segment nodes into slices, not to work on the whole df
+        # [
+        #     [0, 2000], [2000, 6000], [6000, 14000], [14000, 30000],
+        #     [30000, 62000], [62000, 94000], [94000, 126000], ...
+        # ]
+        # (with a limit, only the nearest nodes of the slices needed to reach
+        # it are kept)
+        slices, num_nearest = _limit_slices(len(nodes.index), limit)
+        if num_nearest < len(nodes.index):
+            nodes = nodes.take(_radial_select(nodes["|node - start|"].values,
+                                              num_nearest))
+        if limit is None:
+            limit = len(nodes_input.index)
+
+        # distance-sort from start_node
+        nodes.sort_values("|node - start|", inplace=True, kind="mergesort",
+                          ignore_index=True)
 
-    # make start_node the origin of the axes
-    nodes = _start_offset(nodes_input, start_node_id)
+    # number of nodes anti-clockwise filtered and cost_sorted from prev
+    # node, in order to iteretively pop the next nodes in the STRIDE
+    SPIRAL_WINDOW = 400
+    STRIDE = 15
 
-    # initialize previous node with the start node (series)
-    start_node = nodes.loc[nodes["node_id"] == start_node_id]
-    prev_node = start_node.iloc[0]
+    # this is the container that the sorting algorithm will work with
+    # (empty, but with the dtypes of nodes, so that the concatenations
+    # keep the int32 codes, instead of turning them into objects)
+    remaining_nodes = nodes.iloc[:0]
+
+    with stats.phase("strides"):
+        for idx, slicing_obj in enumerate(slices):
+
+            # moving to more distant slices, spiral_window gets bigger, as
+            # the nodes are more spread out away from the start node
+            spiral_window = int(SPIRAL_WINDOW + 100 * idx)
+
+            # Concat with the remainder of the nodes (which is the half of
+            # the previous slice), in order to have continuity.
+            # (For example, previous to last node will only have the last
+            # remaining node to find the next cost-sorted node, which is
+            # not correct, because there are other candidates, not included
+            # in the current slice.)
+            remaining_nodes = pd.concat([remaining_nodes, nodes[slicing_obj]])
+
+            half_slice = utils.calc_half_slice(slicing_obj)
+            stats.count("slices")
+            stats.sample("slice_size", len(remaining_nodes.index))
+
+            # leave half_slice remaining nodes to merge with the next slice
+            # except from the last slice
+            if (slicing_obj in slices[: -1]) and (len(slices) > 1):
+                strides = (len(remaining_nodes.index) - half_slice) // STRIDE
+            else:
+                strides = - (-len(remaining_nodes.index) // STRIDE)
+
+            for _ in range(strides):
+                remaining_nodes, node_ids, prev_node = _spiral_stride(
+                    remaining_nodes,
+                    node_ids,
+                    prev_node,
+                    spiral_window,
+                    STRIDE,
+                    window_selection
+                )
+                if len(node_ids) >= limit:
+                    break
+            if len(node_ids) >= limit:
+                break
+
+    # the spiral-sorted codes are the permutation of the input rows
+    return np.asarray(node_ids[:limit], dtype=np.int64)
+
+
+def spiralsort_iter(nodes_input,
+                    start_node_id,
+                    window_selection="sort",
+                    chunk_size=config.STRIDE,
+                    return_order=False):
+    """SpiralSorts the point-cloud lazily, yielding the sorted nodes from
+    the start_node outwards, as the strides are popped.
+
+    The nodes are distance-sorted from the start_node only as far as
+    each slice needs (see _radial_sort_lazy), so the first chunk follows
+    a partial selection of the first slice and its first strides, and
+    the consumer can start working long before the whole point-cloud is
+    sorted. At most chunk_size + STRIDE sorted nodes are buffered. The
+    numpy engine is used; the chunks concatenate into the same order as
+    spiralsorted. (The grid window_selection distance-sorts all the
+    nodes upfront, as its grid is built over the whole cloud.)
 
-    # drop start node
-    nodes.drop(start_node.index, inplace=True)
+    Args:
+        nodes_input (df)        :  the point-cloud
+        start_node_id (str)     :  the node where spiralsorting starts
+        window_selection (str)  :  see spiralsorted (default sort)
+        chunk_size (int)        :  a chunk is yielded once at least that
+                                   many nodes are sorted
+                                   (default config.STRIDE, every stride)
+        return_order (bool)     :  yield the input rows (int64), instead
+                                   of the node_ids (default False)
+
+    Yields:
+        chunk (array)           :  the node_ids (or the input rows) of
+                                   the next spiralsorted nodes
+    """
+    _check_engine("numpy", window_selection)
+    utils.check_duplicated_ids(nodes_input)
 
-    # distance of all nodes from the start node
-    nodes["|node - start|"] = _distances_from_node(nodes, prev_node)
+    node_ids = nodes_input["node_id"].values
+    start_row = _start_row(nodes_input, start_node_id)
+    rows, cloud, prepare_slice = _radial_sort_lazy(_node_arrays(nodes_input),
+                                                   start_row)
+    slices = utils.create_slices(rows)
+    if window_selection == "grid":
+        prepare_slice(slice(0, len(rows)))
+
+    buffered = [np.array([start_row])]
+    num_buffered = 1
+    for popped in _spiral_strides_numpy(cloud, slices, window_selection,
+                                        prepare_slice):
+        buffered.append(rows[popped])
+        num_buffered += len(popped)
+        if num_buffered >= chunk_size:
+            chunk = np.concatenate(buffered)
+            yield chunk if return_order else node_ids.take(chunk)
+            buffered, num_buffered = [], 0
+    if num_buffered:
+        chunk = np.concatenate(buffered)
+        yield chunk if return_order else node_ids.take(chunk)
 
-    # distance-sort from start_node
-    nodes.sort_values("|node - start|", inplace=True, kind="mergesort",
-                      ignore_index=True)
 
-    # segment nodes into slices, not to work on the whole df
-    # [
-    #     [0, 2000], [2000, 6000], [6000, 14000], [14000, 30000],
-    #     [30000, 62000], [62000, 94000], [94000, 126000], ...
-    # ]
-    slices = utils.create_slices(nodes)
+@time_this
+def spiralsorted_multistart(nodes_input,
+                            start_node_ids,
+                            window_selection="sort",
+                            threads=None,
+                            return_order=False,
+                            processes=None):
+    """SpiralSorts the same point-cloud from each of the start_node_ids.
+
+    What doesn't depend on the start node is done once: the node_id
+    uniqueness check, the node_id -> row lookup and the float32 x, y, z
+    arrays. The radial sort and the spiral_window selection (the voxel
+    grid, too) depend on the start node, so they are repeated per start.
+    The starts run at a thread pool, sharing the arrays; the numba
+    kernels release the GIL, so they run in parallel. With processes,
+    they run at a process pool instead (for the python part of the
+    stride loop to run in parallel, too), attaching the arrays from a
+    shared store and writing the orders into a shared buffer, so nothing
+    but the array handles is pickled. The numpy engine is used.
 
-    # number of nodes anti-clockwise filtered and cost_sorted from prev
-    # node, in order to iteretively pop the next nodes in the STRIDE
-    SPIRAL_WINDOW = 400
-    STRIDE = 15
+    Args:
+        nodes_input (df)        :  the point-cloud
+        start_node_ids (list)   :  the nodes where spiralsorting starts
+        window_selection (str)  :  see spiralsorted (default sort)
+        threads (int)           :  the number of starts sorted at the
+                                   same time, or the numba threads of
+                                   each worker, with processes
+                                   (default the number of cores)
+        return_order (bool)     :  see spiralsorted (default False)
+        processes (int)         :  sort the starts at that many worker
+                                   processes, instead of threads
+                                   (default None)
 
-    # this is the container that the sorting algorithm will work with
-    remaining_nodes = pd.DataFrame(columns=nodes.columns)
+    Returns:
+        nodes_sorted (list)     :  the spiralsorted point-cloud (df), or
+                                   the order (array), per start_node_id
+    """
+    _check_engine("numpy", window_selection)
+    utils.check_duplicated_ids(nodes_input)
 
-    for idx, slicing_obj in enumerate(slices):
+    start_rows = pd.Index(nodes_input["node_id"]).get_indexer(start_node_ids)
+    if (start_rows == -1).any():
+        missing = np.asarray(start_node_ids)[start_rows == -1].tolist()
+        raise ValueError(f"start_node_ids not found: {missing}")
+
+    if processes is not None:
+        # spawn, since numba's threading layers are not fork-safe
+        with shared.shared_cloud(nodes_input,
+                                 num_orders=len(start_rows)) as handles, \
+             ProcessPoolExecutor(
+                 max_workers=processes,
+                 mp_context=multiprocessing.get_context("spawn"),
+                 initializer=_init_worker,
+                 initargs=(threads,)) as pool:
+            for future in [pool.submit(_multistart_job, handles, idx,
+                                       start_row, window_selection)
+                           for idx, start_row in enumerate(start_rows)]:
+                future.result()
+            orders = np.array(shared.attach(handles["order"], mode='r'))
+        return [order if return_order else _take_rows(nodes_input, order)
+                for order in orders]
+
+    nodes_xyz = _node_arrays(nodes_input)
+
+    def spiralsort_from(start_row):
+        rows, cloud = _radial_sort_arrays(nodes_xyz, start_row)
+        order = _spiral_order_numpy(start_row, rows, cloud, window_selection)
+        return order if return_order else _take_rows(nodes_input, order)
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        nodes_sorted = list(pool.map(spiralsort_from, start_rows))
+    return nodes_sorted
 
-        # moving to more distant slices, spiral_window gets bigger, as
-        # the nodes are more spread out away from the start node
-        spiral_window = int(SPIRAL_WINDOW + 100 * idx)
 
-        # Concat with the remainder of the nodes (which is the half of
-        # the previous slice), in order to have continuity.
-        # (For example, previous to last node will only have the last
-        # remaining node to find the next cost-sorted node, which is
-        # not correct, because there are other candidates, not included
-        # in the current slice.)
-        remaining_nodes = pd.concat([remaining_nodes, nodes[slicing_obj]])
+def _multistart_job(handles, idx, start_row, window_selection):
+    """a spiralsorted_multistart job at a worker process: spiralsorts from
+    start_row, writing the order into the idx row of the shared order
+    buffer (handles of shared.shared_cloud)"""
+    nodes_xyz = tuple(shared.attach(handles[axis], mode='r')
+                      for axis in ('x', 'y', 'z'))
+    rows, cloud = _radial_sort_arrays(nodes_xyz, start_row)
+    order = shared.attach(handles["order"])
+    order[idx] = _spiral_order_numpy(start_row, rows, cloud, window_selection)
+    order.flush()
 
-        half_slice = utils.calc_half_slice(slicing_obj)
 
-        # leave half_slice remaining nodes to merge with the next slice
-        # except from the last slice
-        if (slicing_obj in slices[: -1]) and (len(slices) > 1):
-            strides = (len(remaining_nodes.index) - half_slice) // STRIDE
-        else:
-            strides = - (-len(remaining_nodes.index) // STRIDE)
+def _init_worker(threads):
+    """initializer of the worker processes (spiralsorted_many,
+    spiralsorted_multistart, spiralsorted_sectors)
 
-        for _ in range(strides):
-            remaining_nodes, node_ids, prev_node = _spiral_stride(
-                remaining_nodes,
-                node_ids,
-                prev_node,
-                spiral_window,
-                STRIDE
-            )
+    Importing this module at the worker loads the cached numba kernels,
+    once per worker.
+    """
+    if threads is not None:
+        nb.set_num_threads(threads)
 
-    # return start node to nodes
-    nodes = pd.concat([start_node, nodes])
-    # reorder nodes with respect to the spiral-sorted node_ids
-    node_ids = pd.DataFrame({"node_id": node_ids})
-    nodes_sorted = node_ids.merge(nodes_input, on="node_id")      \
-                           .loc[:, ["node_id", 'x', 'y', 'z']]    \
-                           .reset_index(drop=True, inplace=False)
 
-    return nodes_sorted
+def _spiralsort_file(file_path,
+                     start_node_id,
+                     output_format,
+                     engine,
+                     window_selection,
+                     payload,
+                     limit):
+    """a spiralsorted_many job: reads, spiralsorts and writes the
+    point-cloud of file_path
+
+    Returns:
+        result (JobResult)  :  the error field holds the exception
+                               message of a failed job
+    """
+    start = timer()
+    output_file = None
+    num_nodes = 0
+    try:
+        nodes = io.read_data_file(file_path, payload)
+        num_nodes = len(nodes.index)
+        with pd.option_context("mode.chained_assignment", "raise"):
+            # skip the duration print of time_this
+            nodes_sorted = spiralsorted.__wrapped__(
+                nodes, start_node_id, engine, window_selection,
+                limit=limit)
+        output_file = io.output_file_path(file_path, output_format)
+        io.write_output(nodes_sorted, output_file)
+        error = None
+    except Exception as e:
+        output_file = None
+        error = f"{type(e).__name__}: {e}"
+    return JobResult(file_path, start_node_id, output_file, num_nodes,
+                     timer() - start, error)
+
+
+def spiralsorted_many(jobs,
+                      output_format=None,
+                      engine="pandas",
+                      window_selection="sort",
+                      processes=None,
+                      threads=None,
+                      payload=None,
+                      limit=None):
+    """SpiralSorts many point-cloud files over a process pool.
+
+    The worker processes stay alive across jobs, so that the interpreter
+    start-up and the numba cache loading are paid once per worker and
+    not once per file. Each job writes its output file as soon as it
+    completes. A failed job doesn't stop the rest of them.
+
+    Args:
+        jobs (iterable)         :  (file_path, start_node_id) pairs
+        output_format (str)     :  defaults to the format of each input
+        engine (str)            :  see spiralsorted (default pandas)
+        window_selection (str)  :  see spiralsorted (default sort)
+        processes (int)         :  the number of worker processes
+                                   (default the number of cores)
+        threads (int)           :  the numba threads of each worker
+                                   (default all cores)
+        payload (bool or list)  :  the payload columns to pass through,
+                                   see io.read_data_file (default None)
+        limit (int)             :  see spiralsorted (default None)
+
+    Yields:
+        result (JobResult)      :  one per job, in the order of completion
+    """
+    _check_engine(engine, window_selection)
+
+    # spawn, since numba's threading layers are not fork-safe
+    with ProcessPoolExecutor(max_workers=processes,
+                             mp_context=multiprocessing.get_context("spawn"),
+                             initializer=_init_worker,
+                             initargs=(threads,)) as pool:
+        futures = [pool.submit(_spiralsort_file, file_path, start_node_id,
+                               output_format, engine, window_selection,
+                               payload, limit)
+                   for file_path, start_node_id in jobs]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+# the shared arrays of the distance-sorted cloud
+CLOUD_ARRAYS = ('x', 'y', 'z', "d_start", "theta")
+
+
+def _sector_order(handles, begin, end, window_selection):
+    """a spiralsorted_sectors job: spiralsorts the nodes of a sector, on
+    their own
+
+    The cloud and the positions of the sector nodes (distance-sorted)
+    are attached from the shared store and the spiralsorted positions
+    are written into the shared order buffer.
+
+    Args:
+        handles (dict)          :  the SharedArrays of the CLOUD_ARRAYS,
+                                   positions and order
+        begin, end (int)        :  the range of the sector at positions
+                                   and order
+        window_selection (str)
+    """
+    positions = shared.attach(handles["positions"], mode='r')[begin:end]
+    sector_cloud = tuple(shared.attach(handles[name], mode='r')[positions]
+                         for name in CLOUD_ARRAYS)
+    slices = utils.create_slices(positions)
+    popped = list(_spiral_strides_numpy(sector_cloud, slices,
+                                        window_selection))
+    if popped:
+        order = shared.attach(handles["order"])
+        order[begin:end] = positions[np.concatenate(popped)]
+        order.flush()
+
+
+def _sector_jobs(cloud, shell, num_sectors):
+    """splits a shell (a slice) of the distance-sorted cloud into angular
+    sectors around the start_node
+
+    Returns:
+        sectors (list)  :  the positions of the nodes of each sector,
+                           distance-sorted, counterclockwise from -pi
+    """
+    positions = np.arange(*shell.indices(len(cloud[0])))
+    sector = np.minimum(
+        ((cloud[4][positions] + np.pi) * num_sectors / (2 * np.pi))
+        .astype(np.int64),
+        num_sectors - 1
+    )
+    return [positions[sector == idx] for idx in range(num_sectors)]
+
+
+@time_this
+def spiralsorted_sectors(nodes_input,
+                         start_node_id,
+                         num_sectors=config.SECTORS,
+                         window_selection="sort",
+                         processes=None,
+                         parallel_from=config.SECTOR_FROM,
+                         return_order=False):
+    """SpiralSorts the far slices of a large point-cloud in parallel, by
+    angular sectors.
+
+    The slices up to parallel_from nodes are spiralsorted as usual, all
+    of their nodes popped. Each of the next slices is a shell around the
+    start_node, split into num_sectors angular sectors, which are
+    spiralsorted on their own at a process pool. The sectors of a shell
+    are stitched counterclockwise, starting from the sector of the last
+    sorted node, so the path keeps a single rotational direction; the
+    shells follow each other outwards. The order is not the sequential
+    one; spiral_quality measures how close it is. The numpy engine is
+    used.
+
+    Args:
+        nodes_input (df)        :  the point-cloud
+        start_node_id (str)     :  the node where spiralsorting starts
+        num_sectors (int)       :  sectors per far slice
+                                   (default config.SECTORS)
+        window_selection (str)  :  see spiralsorted (default sort)
+        processes (int)         :  the worker processes
+                                   (default the number of cores)
+        parallel_from (int)     :  the slices starting beyond that many
+                                   nodes are sorted by sectors
+                                   (default config.SECTOR_FROM)
+        return_order (bool)     :  see spiralsorted (default False)
+
+    Returns:
+        nodes_sorted (df)       :  the spiralsorted point-cloud, or
+        order (array)           :  the input rows in the spiralsorted
+                                   order (int64), if return_order
+    """
+    _check_engine("numpy", window_selection)
+    utils.check_duplicated_ids(nodes_input)
+
+    start_row, rows, cloud = _radial_sort_numpy(nodes_input, start_node_id)
+    slices = utils.create_slices(rows)
+    num_inner = next((idx for idx, slicing_obj in enumerate(slices)
+                      if slicing_obj.start >= parallel_from), len(slices))
+    shells = [slicing_obj for slicing_obj in slices[num_inner:]
+              if slicing_obj.start < len(rows)]
+
+    popped = list(_spiral_strides_numpy(cloud, slices[:num_inner],
+                                        window_selection))
+    last_theta = cloud[4][popped[-1][-1]] if popped else np.float32(0)
+
+    if shells:
+        # the sectors of all shells, back to back, at a shared store
+        sectors = [positions for shell in shells
+                   for positions in _sector_jobs(cloud, shell, num_sectors)]
+        bounds = np.cumsum([0] + [len(positions) for positions in sectors])
+        arrays = dict(zip(CLOUD_ARRAYS, cloud))
+        arrays["positions"] = np.concatenate(sectors)
+        buffers = {"order": ((bounds[-1],), np.int64)}
+        # spawn, since numba's threading layers are not fork-safe
+        with shared.shared_arrays(arrays, buffers) as handles, \
+             ProcessPoolExecutor(
+                 max_workers=processes,
+                 mp_context=multiprocessing.get_context("spawn"),
+                 initializer=_init_worker,
+                 initargs=(1,)) as pool:
+            futures = [pool.submit(_sector_order, handles, begin, end,
+                                   window_selection)
+                       for begin, end in zip(bounds[:-1], bounds[1:])]
+            sectors_order = shared.attach(handles["order"], mode='r')
+            for shell_idx in range(len(shells)):
+                first = int((last_theta + np.pi) * num_sectors
+                            / (2 * np.pi)) % num_sectors
+                for idx in range(first, first + num_sectors):
+                    job = shell_idx * num_sectors + idx % num_sectors
+                    futures[job].result()
+                    if bounds[job + 1] > bounds[job]:
+                        popped.append(np.array(
+                            sectors_order[bounds[job]:bounds[job + 1]]))
+                        last_theta = cloud[4][popped[-1][-1]]
+            del sectors_order
+
+    order = np.concatenate([[start_row], rows[np.concatenate(popped)]]) \
+        if popped else np.array([start_row])
+    return order if return_order else _take_rows(nodes_input, order)
+
+
+def spiral_quality(nodes_input, order):
+    """measures how spiral-like an order of the point-cloud is, to compare
+    orders of the same point-cloud (e.g. spiralsorted_sectors against
+    spiralsorted)
+
+    Args:
+        nodes_input (df)  :  the point-cloud
+        order (array)     :  its rows, starting from the start_node
+
+    Returns:
+        quality (SpiralQuality)
+            path_length       :  the sum of the steps between consecutive
+                                 nodes
+            max_step          :  the longest of them
+            counterclockwise  :  the fraction of the steps (after the
+                                 start_node) that turn counterclockwise
+                                 around the start_node
+    """
+    x, y, z = (axis[order].astype(np.float64)
+               for axis in _node_arrays(nodes_input))
+    steps = np.sqrt(np.diff(x) ** 2 + np.diff(y) ** 2 + np.diff(z) ** 2)
+    d_theta = np.diff(np.arctan2(y[1:] - y[0], x[1:] - x[0]))
+    d_theta = (d_theta + np.pi) % (2 * np.pi) - np.pi
+    return SpiralQuality(
+        path_length=steps.sum(),
+        max_step=steps.max() if len(steps) else 0.,
+        counterclockwise=(d_theta >= 0).mean() if len(d_theta) else 1.
+    )
+
+
+def spiral_difference(nodes_input, order, reference):
+    """measures how far an order of the point-cloud is from a reference
+    order (e.g. spiralsorted_sectors from spiralsorted)
+
+    Args:
+        nodes_input (df)   :  the point-cloud
+        order (array)      :  its rows, starting from the start_node
+        reference (array)  :  its rows, in the reference order
+
+    Returns:
+        difference (SpiralDifference)
+            path_length       :  the relative difference of the path
+                                 lengths (see spiral_quality)
+            max_step          :  the relative difference of the longest
+                                 steps
+            counterclockwise  :  the difference of the fractions of the
+                                 counterclockwise steps
+            mean_rank_shift   :  the mean of the nodes' shifts of rank,
+                                 from the reference order
+            max_rank_shift    :  the largest of them
+    """
+    quality = spiral_quality(nodes_input, order)
+    reference_quality = spiral_quality(nodes_input, reference)
+    ranks = np.empty(len(order), dtype=np.int64)
+    ranks[order] = np.arange(len(order))
+    reference_ranks = np.empty(len(reference), dtype=np.int64)
+    reference_ranks[reference] = np.arange(len(reference))
+    rank_shifts = np.abs(ranks - reference_ranks)
+    return SpiralDifference(
+        path_length=(quality.path_length / reference_quality.path_length
+                     - 1 if reference_quality.path_length else 0.),
+        max_step=(quality.max_step / reference_quality.max_step - 1
+                  if reference_quality.max_step else 0.),
+        counterclockwise=(quality.counterclockwise
+                          - reference_quality.counterclockwise),
+        mean_rank_shift=rank_shifts.mean() if len(rank_shifts) else 0.,
+        max_rank_shift=rank_shifts.max() if len(rank_shifts) else 0
+    )
+
+
+def numba_kernels():
+    """the numba kernels of core and spatial
+
+    They are compiled (or loaded from the cache) at import, since they
+    are declared with explicit signatures. (Empty when NUMBA_DISABLE_JIT
+    is set.)
+    """
+    return [kernel
+            for module in (sys.modules[__name__], spatial)
+            for kernel in vars(module).values()
+            if isinstance(kernel, nb.core.dispatcher.Dispatcher)]
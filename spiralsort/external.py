@@ -0,0 +1,381 @@
+# external.py is part of SpiralSort
+#
+# SpiralSort is free software; you may redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version. You should have received a copy of the GNU
+# General Public License along with this program. If not, see
+# <https://www.gnu.org/licenses/>.
+#
+# (C) 2020 Athanasios Mattas
+# ======================================================================
+"""Out-of-core spiralsorting, for point-clouds larger than the memory.
+
+The point-cloud is staged into binary files at a work directory and
+every pass over it is chunked:
+
+1. stage: the input csv is read in chunks into a float32 x, y, z memmap
+   and a node_id store
+2. radial sort: an external sort, where the chunks are distance-sorted
+   from the start node into runs, which are merged into the radial
+   order memmaps
+3. spiralsort: the slices are streamed out of the radial order, holding
+   only the remaining nodes of the previous slice and the current slice,
+   while the popped rows are appended to the order file
+4. write: the output is written in chunks, following the order file
+
+So, the memory used is bounded by the chunk and the slice sizes and not
+by the size of the point-cloud.
+"""
+
+from collections import namedtuple
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from spiralsort import config, core, io, stats, utils
+from spiralsort.utils import time_this
+
+
+# the node_ids of a chunk of rows, stored as fixed-width utf-8 bytes
+IdChunk = namedtuple("IdChunk", ["row_start", "num_rows", "offset", "width"])
+
+# a record of the sorted runs of the radial sort
+RUN_DTYPE = np.dtype([("d", np.float32), ("row", np.int64)])
+
+
+def _open_memmap(path, dtype, shape=None):
+    """read-only memmap of a work file (empty files can't be mapped)"""
+    if os.path.getsize(path) == 0:
+        return np.empty((0,) + (shape or ())[1:], dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r', shape=shape)
+
+
+def _stage(file_path, start_node_id, work_dir, chunk_size):
+    """reads the csv point-cloud in chunks into the work_dir
+
+    Returns:
+        xyz (memmap)        :  the float32 x, y, z of the nodes (N x 3)
+        id_chunks (list)    :  the IdChunks of the node_id store
+        start_row (int)     :  the row of the start_node
+    """
+    id_chunks = []
+    start_row = None
+    num_rows = 0
+    offset = 0
+    with open(os.path.join(work_dir, "xyz.bin"), "wb") as xyz_file, \
+         open(os.path.join(work_dir, "ids.bin"), "wb") as ids_file:
+        for nodes in pd.read_csv(file_path,
+                                 usecols=["node_id", 'x', 'y', 'z'],
+                                 dtype={"node_id": str,
+                                        'x': np.float32,
+                                        'y': np.float32,
+                                        'z': np.float32},
+                                 chunksize=chunk_size):
+            xyz_file.write(
+                nodes.loc[:, ['x', 'y', 'z']].to_numpy(np.float32).tobytes()
+            )
+            ids = np.char.encode(nodes["node_id"].to_numpy(str), "utf-8")
+            ids_file.write(ids.tobytes())
+            id_chunks.append(IdChunk(num_rows, len(ids), offset,
+                                     ids.dtype.itemsize))
+            if start_row is None:
+                hits = np.flatnonzero(nodes["node_id"].values == start_node_id)
+                if len(hits):
+                    start_row = num_rows + hits[0]
+            num_rows += len(ids)
+            offset += ids.nbytes
+
+    if start_row is None:
+        raise ValueError(f"start_node_id {start_node_id} not found")
+    xyz = _open_memmap(os.path.join(work_dir, "xyz.bin"), np.float32,
+                       (num_rows, 3))
+    return xyz, id_chunks, start_row
+
+
+def _gather_ids(work_dir, id_chunks, rows):
+    """the node_ids of rows, out of the node_id store"""
+    row_starts = [id_chunk.row_start for id_chunk in id_chunks]
+    chunk_of_row = np.searchsorted(row_starts, rows, side="right") - 1
+    ids = np.empty(len(rows), dtype=object)
+    for k in np.unique(chunk_of_row):
+        id_chunk = id_chunks[k]
+        store = np.memmap(os.path.join(work_dir, "ids.bin"),
+                          dtype=f"S{id_chunk.width}", mode='r',
+                          offset=id_chunk.offset,
+                          shape=(id_chunk.num_rows,))
+        in_chunk = chunk_of_row == k
+        ids[in_chunk] = np.char.decode(
+            store[rows[in_chunk] - id_chunk.row_start], "utf-8")
+    return ids
+
+
+def _sorted_runs(xyz, start_row, work_dir, chunk_size):
+    """distance-sorts each chunk of the nodes from the start_node (the
+    start_node excluded) into a run file
+
+    The runs are sorted by (|node - start|, row), as the stable sort of
+    _radial_sort_numpy.
+
+    Returns:
+        run_paths (list)
+    """
+    start_xyz = np.array(xyz[start_row])
+    run_paths = []
+    for k, row_start in enumerate(range(0, len(xyz), chunk_size)):
+        nodes_xyz = np.array(xyz[row_start:row_start + chunk_size])
+        x, y, z = (np.ascontiguousarray(nodes_xyz[:, axis] - start_xyz[axis])
+                   for axis in range(3))
+        rows = np.arange(row_start, row_start + len(nodes_xyz))
+        d_start = core._distances_from_node_numpy(x, y, z, np.float32(0),
+                                                  np.float32(0),
+                                                  np.float32(0))
+        not_start = rows != start_row
+        d_start = d_start[not_start]
+        rows = rows[not_start]
+
+        order = np.argsort(d_start, kind="mergesort")
+        run = np.empty(len(order), dtype=RUN_DTYPE)
+        run["d"] = d_start[order]
+        run["row"] = rows[order]
+        run_paths.append(os.path.join(work_dir, f"run_{k}.bin"))
+        run.tofile(run_paths[-1])
+    return run_paths
+
+
+def _merge_runs(run_paths, work_dir, chunk_size):
+    """k-way merges the sorted runs into the radial order, a block per run
+    at a time
+
+    At each step, all the nodes up to the smallest of the last nodes of
+    the blocks of the unfinished runs are in their final order, so they
+    are sorted and written.
+
+    Returns:
+        radial_rows (memmap)  :  the rows, distance-sorted from the start
+        radial_d (memmap)     :  their |node - start|
+    """
+    runs = [_open_memmap(path, RUN_DTYPE) for path in run_paths]
+    heads = [0] * len(runs)
+    block = max(chunk_size // max(len(runs), 1), 1)
+    rows_path = os.path.join(work_dir, "radial_rows.bin")
+    d_path = os.path.join(work_dir, "radial_d.bin")
+
+    with open(rows_path, "wb") as rows_file, open(d_path, "wb") as d_file:
+        while True:
+            blocks = [np.array(run[head:head + block])
+                      for run, head in zip(runs, heads)]
+            if not any(len(run_block) for run_block in blocks):
+                break
+            bounds = [run_block[-1]
+                      for run, head, run_block in zip(runs, heads, blocks)
+                      if head + len(run_block) < len(run)]
+            if bounds:
+                bound = min(bounds, key=lambda node: (node["d"], node["row"]))
+            merged = []
+            for k, run_block in enumerate(blocks):
+                if bounds:
+                    run_block = run_block[
+                        (run_block["d"] < bound["d"])
+                        | ((run_block["d"] == bound["d"])
+                           & (run_block["row"] <= bound["row"]))
+                    ]
+                heads[k] += len(run_block)
+                merged.append(run_block)
+            merged = np.concatenate(merged)
+            merged = merged[np.lexsort((merged["row"], merged["d"]))]
+            rows_file.write(merged["row"].tobytes())
+            d_file.write(merged["d"].tobytes())
+
+    return _open_memmap(rows_path, np.int64), _open_memmap(d_path, np.float32)
+
+
+def _load_slice(xyz, start_xyz, radial_rows, radial_d, slicing_obj):
+    """reads a slice of the radial order and gathers its nodes
+
+    The nodes are read from xyz in ascending row order, so that the
+    memory-mapped file is read sequentially.
+
+    Returns:
+        rows (array)         :  the rows of the slice, distance-sorted
+        slice_cloud (tuple)  :  their x, y, z, offset to the start_node,
+                                |node - start| and angles from the 0x
+                                axis
+    """
+    rows = np.array(radial_rows[slicing_obj])
+    row_order = np.argsort(rows, kind="stable")
+    nodes_xyz = np.empty((len(rows), 3), dtype=np.float32)
+    nodes_xyz[row_order] = xyz[rows[row_order]]
+    x, y, z = (np.ascontiguousarray(nodes_xyz[:, axis] - start_xyz[axis])
+               for axis in range(3))
+    return rows, (x, y, z, np.array(radial_d[slicing_obj]),
+                  core._xy_angle_numpy(x, y))
+
+
+def _spiral_strides_external(xyz, start_row, radial_rows, radial_d,
+                             window_selection="sort", prefetch=True):
+    """core._spiral_strides_numpy, streaming the slices out of the radial
+    order
+
+    The remaining nodes of the previous slices, in the order of
+    remaining, followed by the current slice, make up a local cloud, so
+    the windows, the ties and the popped nodes are the same as in the
+    in-memory sort and partition window_selections. The next slice is
+    loaded at a background thread, while the current one is being
+    popped.
+
+    Args:
+        xyz (memmap)            :  the float32 x, y, z of the nodes
+        start_row (int)         :  the row of the start_node
+        radial_rows (memmap)    :  the rows, distance-sorted
+        radial_d (memmap)       :  their |node - start|
+        window_selection (str)  :  sort or partition (default sort)
+        prefetch (bool)         :  load the next slice in the background
+                                   (default True)
+
+    Yields:
+        popped_rows (array)     :  the rows of the nodes popped at a
+                                   stride
+    """
+    start_xyz = np.array(xyz[start_row])
+    slices = utils.create_slices(radial_rows)
+    cloud = tuple(np.empty(0, dtype=np.float32) for _ in range(5))
+    cloud_rows = np.empty(0, dtype=np.int64)
+    remaining = np.empty(0, dtype=np.int64)
+
+    # the start node is the origin
+    prev_xyz = (np.float32(0), np.float32(0), np.float32(0))
+    prev_theta = np.float32(0)
+    num_sorted = 1
+
+    def load_slice(slicing_obj):
+        return _load_slice(xyz, start_xyz, radial_rows, radial_d,
+                           slicing_obj)
+
+    loaded_slices = core._prefetched(load_slice, slices) if prefetch \
+        else map(load_slice, slices)
+    for idx, (slicing_obj, (rows, slice_cloud)) in enumerate(
+            zip(slices, loaded_slices)):
+        spiral_window = int(config.SPIRAL_WINDOW + 100 * idx)
+        cloud = tuple(np.concatenate([axis[remaining], slice_axis])
+                      for axis, slice_axis in zip(cloud, slice_cloud))
+        cloud_rows = np.concatenate([cloud_rows[remaining], rows])
+        remaining = np.arange(len(cloud_rows))
+        alive = np.ones(len(cloud_rows), dtype=np.bool_)
+        strides = core._num_strides(len(remaining), slicing_obj,
+                                    idx == len(slices) - 1)
+        stats.count("slices")
+        stats.sample("slice_size", len(remaining))
+
+        for _ in range(strides):
+            with stats.phase("window"):
+                if num_sorted > 1000:
+                    window, remaining = core._select_window(
+                        cloud, remaining, prev_xyz, prev_theta,
+                        spiral_window, window_selection
+                    )
+                else:
+                    window = remaining[:spiral_window]
+
+            with stats.phase("pop"):
+                popped, num_fallbacks = core._pop_stride_numpy(
+                    *cloud, window, *prev_xyz, prev_theta, config.STRIDE,
+                    len(window) >= config.PARALLEL_WINDOW
+                )
+            stats.count("strides")
+            stats.count("pops", len(popped))
+            stats.count("filter_fallbacks", num_fallbacks)
+            stats.sample("window_size", len(window))
+            if not len(popped):
+                continue
+            prev_xyz = tuple(axis[popped[-1]] for axis in cloud[:3])
+            prev_theta = cloud[4][popped[-1]]
+            alive[popped] = False
+            remaining = remaining[alive[remaining]]
+            num_sorted += len(popped)
+            yield cloud_rows[popped]
+
+
+def _output_chunks(order, xyz, work_dir, id_chunks, chunk_size):
+    """the spiralsorted point-cloud, in chunks of chunk_size nodes"""
+    for row_start in range(0, len(order), chunk_size):
+        rows = np.array(order[row_start:row_start + chunk_size])
+        nodes_xyz = xyz[rows]
+        yield pd.DataFrame(
+            {"node_id": _gather_ids(work_dir, id_chunks, rows),
+             'x': nodes_xyz[:, 0],
+             'y': nodes_xyz[:, 1],
+             'z': nodes_xyz[:, 2]},
+            index=pd.RangeIndex(row_start, row_start + len(rows))
+        )
+
+
+@time_this
+def spiralsorted_file(file_path,
+                      start_node_id,
+                      output_file=None,
+                      window_selection="sort",
+                      work_dir=None,
+                      chunk_size=config.EXTERNAL_CHUNK,
+                      prefetch=True):
+    """SpiralSorts a csv point-cloud that may not fit in memory.
+
+    The same order as spiralsorted, with peak memory bounded by the
+    chunk_size and the slice size, instead of the size of the
+    point-cloud. The node_id uniqueness is not checked.
+
+    Args:
+        file_path (str)         :  the csv point-cloud
+        start_node_id (str)     :  the node where spiralsorting starts
+        output_file (str)       :  a csv (.csv.gz, .csv.zst) path (default
+                                   io.output_file_path(file_path))
+        window_selection (str)  :  sort or partition (default sort)
+        work_dir (str)          :  where the temporary work files are
+                                   kept (default the system's temp dir)
+        chunk_size (int)        :  nodes per chunk
+                                   (default config.EXTERNAL_CHUNK)
+        prefetch (bool)         :  load the next slice in the
+                                   background, while the current one is
+                                   being sorted (default True)
+
+    Returns:
+        output_file (str)
+    """
+    if window_selection not in ("sort", "partition"):
+        raise ValueError(f"window_selection should be sort or partition"
+                         f" for the out-of-core mode, not {window_selection}")
+    if output_file is None:
+        output_file = io.output_file_path(file_path)
+    if io._output_format(output_file)[0] != ".csv":
+        raise ValueError("the out-of-core mode writes only csv files")
+
+    with tempfile.TemporaryDirectory(dir=work_dir) as work_dir:
+        with stats.phase("read"):
+            xyz, id_chunks, start_row = _stage(file_path, start_node_id,
+                                               work_dir, chunk_size)
+        with stats.phase("radial"):
+            run_paths = _sorted_runs(xyz, start_row, work_dir, chunk_size)
+            radial_rows, radial_d = _merge_runs(run_paths, work_dir,
+                                                chunk_size)
+            for path in run_paths:
+                os.remove(path)
+
+        order_path = os.path.join(work_dir, "order.bin")
+        with open(order_path, "wb") as order_file, stats.phase("strides"):
+            order_file.write(np.array([start_row], dtype=np.int64).tobytes())
+            for popped_rows in _spiral_strides_external(xyz, start_row,
+                                                        radial_rows,
+                                                        radial_d,
+                                                        window_selection,
+                                                        prefetch):
+                order_file.write(popped_rows.tobytes())
+
+        with stats.phase("write"):
+            io.write_csv_chunks(
+                _output_chunks(_open_memmap(order_path, np.int64), xyz,
+                               work_dir, id_chunks, chunk_size),
+                output_file
+            )
+    return output_file
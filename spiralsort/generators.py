@@ -0,0 +1,274 @@
+# generators.py is part of SpiralSort
+#
+# SpiralSort is free software; you may redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version. You should have received a copy of the GNU
+# General Public License along with this program. If not, see
+# <https://www.gnu.org/licenses/>.
+#
+# (C) 2020 Athanasios Mattas
+# ======================================================================
+"""Synthetic point-clouds, for benchmarking and load-testing.
+
+Each family draws float32 nodes, vectorised, from a np.random.Generator,
+so the same seed (and chunk_size) gives the same point-cloud. Clouds are
+generated in chunks and can be streamed straight into an input file, so
+their size is bounded by the disk and not by the memory. node_ids are
+the row numbers, which is also what the readers default to, when a
+format does not store them (npy, ply).
+
+families:
+    shell       :  a spherical shell
+    plane       :  a planar 2D scan, with a little noise off the plane
+    clusters    :  gaussian clusters of various sizes and spreads
+    gradient    :  a heavy density gradient along x
+    duplicates  :  nodes of the unit cube, a fraction of them coincident
+                   with other nodes
+
+usage: python -m spiralsort.generators FAMILY NUM_NODES OUTPUT_FILE
+           [--seed SEED] [--chunk-size CHUNK_SIZE]
+"""
+
+import os
+
+import click
+import numpy as np
+import pandas as pd
+
+from spiralsort import config, io
+
+
+def _shell(rng, inner_radius=0.9):
+    """nodes uniformly distributed in the spherical shell of radii
+    inner_radius to 1"""
+    def sample(num_nodes):
+        xyz = rng.standard_normal((3, num_nodes), dtype=np.float32)
+        xyz /= np.linalg.norm(xyz, axis=0)
+        # uniform in volume
+        xyz *= np.cbrt(inner_radius ** 3 + (1 - inner_radius ** 3)
+                       * rng.random(num_nodes, dtype=np.float32))
+        return xyz
+    return sample
+
+
+def _plane(rng, noise=1e-3):
+    """nodes of the unit square on the xy plane, with a gaussian noise
+    of std noise on z"""
+    def sample(num_nodes):
+        xy = rng.random((2, num_nodes), dtype=np.float32)
+        z = rng.standard_normal(num_nodes, dtype=np.float32) * noise
+        return np.vstack([xy, z[None, :]])
+    return sample
+
+
+def _clusters(rng, num_clusters=20, min_spread=0.01, max_spread=0.1):
+    """nodes at gaussian clusters, centered in the unit cube, with
+    spreads (stds) from min_spread to max_spread and random shares of
+    the nodes"""
+    centers = rng.random((3, num_clusters), dtype=np.float32)
+    spreads = rng.uniform(min_spread, max_spread,
+                          num_clusters).astype(np.float32)
+    shares = rng.dirichlet(np.ones(num_clusters))
+
+    def sample(num_nodes):
+        labels = rng.choice(num_clusters, size=num_nodes, p=shares)
+        return centers[:, labels] \
+            + rng.standard_normal((3, num_nodes), dtype=np.float32) \
+            * spreads[labels]
+    return sample
+
+
+def _gradient(rng, exponent=4):
+    """nodes of the unit cube, with x = u ** exponent, so that the density
+    falls as x ** (1 / exponent - 1), away from the x = 0 face"""
+    def sample(num_nodes):
+        xyz = rng.random((3, num_nodes), dtype=np.float32)
+        xyz[0] **= exponent
+        return xyz
+    return sample
+
+
+def _duplicates(rng, fraction=0.1):
+    """nodes of the unit cube, of which a fraction is coincident with
+    other nodes (of the same chunk)"""
+    def sample(num_nodes):
+        xyz = rng.random((3, num_nodes), dtype=np.float32)
+        duplicates = rng.random(num_nodes) < fraction
+        xyz[:, duplicates] = xyz[:, rng.integers(num_nodes,
+                                                 size=duplicates.sum())]
+        return xyz
+    return sample
+
+
+FAMILIES = {
+    "shell": _shell,
+    "plane": _plane,
+    "clusters": _clusters,
+    "gradient": _gradient,
+    "duplicates": _duplicates
+}
+
+
+def _xyz_chunks(family, num_nodes, seed=None,
+                chunk_size=config.WRITE_CHUNK, **params):
+    """yields the first row and the float32 x, y, z arrays of each chunk"""
+    if family not in FAMILIES:
+        raise ValueError(f"unknown family {family}; choose one of"
+                         f" {', '.join(FAMILIES)}")
+    sample = FAMILIES[family](np.random.default_rng(seed), **params)
+    for row_start in range(0, num_nodes, chunk_size):
+        x, y, z = sample(min(chunk_size, num_nodes - row_start))
+        yield row_start, x, y, z
+
+
+def point_cloud_chunks(family, num_nodes, seed=None,
+                       chunk_size=config.WRITE_CHUNK, **params):
+    """yields a synthetic point-cloud in chunks
+
+    Args:
+        family (str)       :  shell, plane, clusters, gradient or
+                              duplicates
+        num_nodes (int)
+        seed (int)         :  or a np.random.Generator (default None,
+                              fresh entropy)
+        chunk_size (int)   :  the nodes per chunk
+                              (default config.WRITE_CHUNK)
+        params             :  the parameters of the family (see the
+                              _<family> functions)
+
+    Yields:
+        chunk (df)         :  the node_id, x, y, z columns of the chunk,
+                              indexed by row
+    """
+    for row_start, x, y, z in _xyz_chunks(family, num_nodes, seed,
+                                          chunk_size, **params):
+        chunk = io._nodes_frame(np.arange(row_start, row_start + len(x)),
+                                x, y, z, {})
+        chunk.index = pd.RangeIndex(row_start, row_start + len(x))
+        yield chunk
+
+
+def point_cloud(family, num_nodes, seed=None, **params):
+    """a synthetic point-cloud (see point_cloud_chunks)
+
+    Returns:
+        nodes (df)
+    """
+    return next(point_cloud_chunks(family, num_nodes, seed,
+                                   max(num_nodes, 1), **params),
+                io._nodes_frame(None, *np.empty((3, 0), np.float32), {}))
+
+
+def _write_arrow_chunks(xyz_chunks, output_file):
+    """streams the chunks into a parquet file (a row group per chunk) or
+    a feather (arrow ipc) file (a record batch per chunk)"""
+    try:
+        import pyarrow as pa
+        from pyarrow import parquet
+    except ModuleNotFoundError:
+        raise ModuleNotFoundError("Writing parquet and feather files"
+                                  " requires pyarrow.")
+    schema = pa.schema([("node_id", pa.int64()), ('x', pa.float32()),
+                        ('y', pa.float32()), ('z', pa.float32())])
+    if output_file.endswith(".parquet"):
+        writer = parquet.ParquetWriter(output_file, schema)
+    else:
+        writer = pa.ipc.new_file(output_file, schema)
+    with writer:
+        for row_start, x, y, z in xyz_chunks:
+            node_id = np.arange(row_start, row_start + len(x))
+            writer.write_table(pa.table([node_id, x, y, z], schema=schema))
+
+
+def _write_npy_chunks(xyz_chunks, output_file, num_nodes):
+    """streams the chunks into a memory-mapped, structured .npy, with
+    x, y, z fields"""
+    nodes = np.lib.format.open_memmap(
+        output_file, mode="w+",
+        dtype=[('x', np.float32), ('y', np.float32), ('z', np.float32)],
+        shape=(num_nodes,)
+    )
+    for row_start, x, y, z in xyz_chunks:
+        for axis, values in zip(('x', 'y', 'z'), (x, y, z)):
+            nodes[axis][row_start:row_start + len(values)] = values
+    nodes.flush()
+
+
+def _write_ply_chunks(xyz_chunks, output_file, num_nodes):
+    """streams the chunks into a binary little-endian PLY, with float
+    x, y, z vertex properties"""
+    header = ("ply\n"
+              "format binary_little_endian 1.0\n"
+              "comment spiralsort synthetic point-cloud\n"
+              f"element vertex {num_nodes}\n"
+              "property float x\n"
+              "property float y\n"
+              "property float z\n"
+              "end_header\n")
+    with open(output_file, "wb") as f:
+        f.write(header.encode("ascii"))
+        for _, x, y, z in xyz_chunks:
+            f.write(np.column_stack([x, y, z]).astype("<f4").tobytes())
+
+
+def write_point_cloud(output_file, family, num_nodes, seed=None,
+                      chunk_size=config.WRITE_CHUNK, threads=None,
+                      **params):
+    """streams a synthetic point-cloud into an input file, a chunk at a
+    time (see point_cloud_chunks)
+    (suported formats: csv, csv.gz, csv.zst, parquet, feather, arrow,
+    npy, ply)
+
+    Args:
+        output_file (str)
+        family (str)
+        num_nodes (int)
+        seed (int)         :  or a np.random.Generator (default None)
+        chunk_size (int)   :  the nodes held in memory at a time
+                              (default config.WRITE_CHUNK)
+        threads (int)      :  the threads compressing a csv
+                              (default all cores)
+        params             :  the parameters of the family
+    """
+    output_format, _ = io._output_format(output_file)
+    xyz_chunks = _xyz_chunks(family, num_nodes, seed, chunk_size,
+                             **params)
+    if output_format == ".csv":
+        io.write_csv_chunks(
+            point_cloud_chunks(family, num_nodes, seed, chunk_size,
+                               **params),
+            output_file,
+            threads
+        )
+    elif output_format in (".parquet", ".feather", ".arrow"):
+        _write_arrow_chunks(xyz_chunks, output_file)
+    elif output_format == ".npy":
+        _write_npy_chunks(xyz_chunks, output_file, num_nodes)
+    elif output_format == ".ply":
+        _write_ply_chunks(xyz_chunks, output_file, num_nodes)
+    else:
+        raise ValueError(f"{output_format} can't be written in chunks;"
+                         f" use csv, parquet, feather, npy or ply")
+
+
+@click.command()
+@click.argument("family", type=click.Choice(list(FAMILIES)))
+@click.argument("num_nodes", type=click.IntRange(1))
+@click.argument("output_file", type=click.Path())
+@click.option("--seed", type=click.INT, default=None,
+              help="the seed of the generator  [default: fresh entropy]")
+@click.option("--chunk-size", type=click.IntRange(1),
+              default=config.WRITE_CHUNK, show_default=True,
+              help="the nodes held in memory at a time")
+def main(family, num_nodes, output_file, seed, chunk_size):
+    """Streams a synthetic point-cloud of NUM_NODES nodes into the
+    OUTPUT_FILE (csv, csv.gz, csv.zst, parquet, feather, arrow, npy or
+    ply). The node_ids are the row numbers."""
+    write_point_cloud(output_file, family, num_nodes, seed, chunk_size)
+    click.echo(f"{num_nodes} {family} nodes written to"
+               f" {os.path.abspath(output_file)}")
+
+
+if __name__ == "__main__":
+    main()
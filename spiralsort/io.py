@@ -11,33 +11,276 @@
 # ======================================================================
 """Basic io functionality."""
 
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import gzip
+from io import BytesIO
 import os
 
 import numpy as np
 import pandas as pd
 
+from spiralsort import config
 
-def read_data_file(input_file):
+
+# PLY property types
+PLY_TYPES = {
+    "char": "i1", "int8": "i1", "uchar": "u1", "uint8": "u1",
+    "short": "i2", "int16": "i2", "ushort": "u2", "uint16": "u2",
+    "int": "i4", "int32": "i4", "uint": "u4", "uint32": "u4",
+    "float": "f4", "float32": "f4", "double": "f8", "float64": "f8"
+}
+
+
+# the columns that go into the engine
+NODE_COLUMNS = ["node_id", 'x', 'y', 'z']
+
+# the suffixes of the compressed csv outputs
+CSV_COMPRESSIONS = (".gz", ".zst")
+
+# the rows an xlsx sheet can hold, besides the header
+XLSX_MAX_ROWS = 1048575
+
+
+def _payload_columns(columns, payload):
+    """the payload columns to be read, out of the available columns
+
+    Args:
+        columns (list)          :  the columns of the input
+        payload (bool or list)  :  True for all the columns but the node
+                                   ones (and unnamed index columns), or
+                                   the payload column names
+
+    Returns:
+        payload_columns (list)
+    """
+    if not payload:
+        return []
+    if payload is True:
+        return [column for column in columns
+                if (column not in NODE_COLUMNS)
+                and not str(column).startswith("Unnamed:")]
+    missing = [column for column in payload if column not in columns]
+    if missing:
+        raise KeyError(f"payload columns not found: {missing}")
+    return list(payload)
+
+
+def _nodes_frame(node_id, x, y, z, payload):
+    """the point-cloud df, out of its columns (node_id defaults to the row
+    numbers), followed by the payload columns"""
+    if node_id is None:
+        node_id = np.arange(len(x))
+    return pd.DataFrame({"node_id": np.asarray(node_id).astype(str)
+                                                     .astype(object),
+                         'x': x,
+                         'y': y,
+                         'z': z,
+                         **payload})
+
+
+def _read_arrow(input_file, payload):
+    """reads the node_id, x, y, z and payload columns of a parquet or
+    feather (arrow ipc) file
+
+    x, y, z are cast to float32 at arrow. The payload columns stay
+    arrow-backed (zero-copy), where pandas supports it.
+    """
+    try:
+        import pyarrow as pa
+        from pyarrow import feather, parquet
+    except ModuleNotFoundError:
+        raise ModuleNotFoundError("Reading parquet and feather files"
+                                  " requires pyarrow.")
+    _, input_format = os.path.splitext(input_file)
+    if input_format == ".parquet":
+        read_table = parquet.read_table
+        column_names = parquet.read_schema(input_file).names
+    else:
+        read_table = feather.read_table
+        with pa.memory_map(input_file) as source:
+            column_names = pa.ipc.open_file(source).schema.names
+    payload_columns = _payload_columns(column_names, payload)
+    table = read_table(input_file, columns=NODE_COLUMNS + payload_columns)
+    node_id = table.column("node_id").to_numpy()
+    x, y, z = (table.column(axis).cast(pa.float32()).to_numpy()
+               for axis in ('x', 'y', 'z'))
+    types_mapper = pd.ArrowDtype if hasattr(pd, "ArrowDtype") else None
+    payload = table.select(payload_columns) \
+                   .to_pandas(types_mapper=types_mapper)
+    return node_id, x, y, z, payload
+
+
+def _read_npy(input_file, payload):
+    """reads a memory-mapped .npy, either a structured array with x, y, z
+    (and optionally node_id and payload) fields or an (N, 3) x, y, z
+    array"""
+    nodes = np.load(input_file, mmap_mode='r')
+    if nodes.dtype.names is None:
+        columns = [None] + [nodes[:, axis] for axis in range(3)]
+        payload_columns = _payload_columns([], payload)
+    else:
+        columns = [nodes["node_id"] if "node_id" in nodes.dtype.names
+                   else None] + [nodes[axis] for axis in ('x', 'y', 'z')]
+        payload_columns = _payload_columns(nodes.dtype.names, payload)
+    return [columns[0]] \
+        + [np.asarray(axis, dtype=np.float32) for axis in columns[1:]] \
+        + [{column: np.array(nodes[column]) for column in payload_columns}]
+
+
+def _read_npz(input_file, payload):
+    """reads an .npz with x, y, z (or an (N, 3) xyz) and optionally
+    node_id and payload arrays, loading only these"""
+    with np.load(input_file) as arrays:
+        node_id = arrays["node_id"] if "node_id" in arrays.files else None
+        if "xyz" in arrays.files:
+            xyz = arrays["xyz"]
+            x, y, z = (np.asarray(xyz[:, axis], dtype=np.float32)
+                       for axis in range(3))
+        else:
+            x, y, z = (np.asarray(arrays[axis], dtype=np.float32)
+                       for axis in ('x', 'y', 'z'))
+        payload_columns = _payload_columns(
+            [name for name in arrays.files if name != "xyz"], payload)
+        payload = {column: arrays[column] for column in payload_columns}
+    return node_id, x, y, z, payload
+
+
+def _read_ply(input_file, payload):
+    """reads the vertices of a binary PLY file, memory-mapped
+
+    node_id is read from a node_id or id vertex property, if there is one,
+    else it defaults to the vertex numbers. The payload columns are the
+    rest of the vertex properties.
+    """
+    elements = []
+    byte_order = None
+    with open(input_file, "rb") as f:
+        if f.readline().strip() != b"ply":
+            raise ValueError(f"{input_file} is not a PLY file")
+        while True:
+            line = f.readline()
+            if not line:
+                raise ValueError(f"{input_file} has no end_header")
+            words = line.decode("ascii").split()
+            if not words or words[0] in ("comment", "obj_info"):
+                continue
+            if (words[0] in ("element", "end_header")) \
+                    and (byte_order is None):
+                raise ValueError(f"{input_file}: missing format line")
+            if words[0] == "end_header":
+                break
+            if words[0] == "format":
+                if words[1] == "ascii":
+                    raise ValueError("only binary PLY files are supported")
+                byte_order = '<' if words[1] == "binary_little_endian" \
+                    else '>'
+            elif words[0] == "element":
+                elements.append((words[1], int(words[2]), []))
+            elif words[0] == "property":
+                if words[1] == "list":
+                    elements[-1][2].append(None)
+                else:
+                    elements[-1][2].append((words[2],
+                                            byte_order + PLY_TYPES[words[1]]))
+        offset = f.tell()
+
+    for name, count, properties in elements:
+        if None in properties:
+            raise ValueError(f"PLY list properties are not supported (at"
+                             f" the {name} element)")
+        dtype = np.dtype(properties)
+        if name == "vertex":
+            break
+        offset += count * dtype.itemsize
+    else:
+        raise ValueError(f"{input_file} has no vertex element")
+
+    vertices = np.memmap(input_file, dtype=dtype, mode='r', offset=offset,
+                         shape=(count,))
+    id_field = next((field for field in ("node_id", "id")
+                     if field in dtype.names), None)
+    node_id = None if id_field is None else vertices[id_field]
+    x, y, z = (vertices[axis].astype(np.float32)
+               for axis in ('x', 'y', 'z'))
+    payload_columns = _payload_columns(
+        [field for field in dtype.names if field != id_field], payload)
+    payload = {column: vertices[column].astype(vertices[column].dtype
+                                               .newbyteorder('='))
+               for column in payload_columns}
+    return node_id, x, y, z, payload
+
+
+def read_data_file(input_file, payload=None):
     """reads the input file and stores it to a DataFrame
-    (suported formats: csv, json)
+    (suported formats: csv, json, parquet, feather, npy, npz, ply)
+
+    The node_id, x, y, z columns are read, followed by the payload
+    columns, if asked for. The binary formats are read straight into
+    float32 x, y, z, without a float64 copy.
+
+    Args:
+        input_file (str)
+        payload (bool or list)  :  True to keep all the other columns,
+                                   or a list of them (default None)
+
+    Returns:
+        nodes (df)
     """
     read_file = {
         ".json": pd.read_json,
-        ".csv": pd.read_csv,
+        ".csv": lambda f: pd.read_csv(
+            f,
+            usecols=None if payload else NODE_COLUMNS,
+            dtype={"node_id": str,
+                   'x': np.float32,
+                   'y': np.float32,
+                   'z': np.float32}
+        ),
+    }
+    read_binary_file = {
+        ".parquet": _read_arrow,
+        ".feather": _read_arrow,
+        ".arrow": _read_arrow,
+        ".npy": _read_npy,
+        ".npz": _read_npz,
+        ".ply": _read_ply
     }
 
     _, input_format = os.path.splitext(input_file)
 
+    if input_format in read_binary_file:
+        return _nodes_frame(*read_binary_file[input_format](input_file,
+                                                            payload))
+
     with open(input_file, 'r') as f:
-        nodes = read_file[input_format](f)      \
-            .loc[:, ["node_id", 'x', 'y', 'z']] \
-            .astype({"node_id": str,
-                     'x': np.float32,
-                     'y': np.float32,
-                     'z': np.float32})
+        nodes = read_file[input_format](f)
+    payload_columns = _payload_columns(nodes.columns, payload)
+    nodes = nodes.loc[:, NODE_COLUMNS + payload_columns] \
+                 .astype({"node_id": str,
+                          'x': np.float32,
+                          'y': np.float32,
+                          'z': np.float32})
     return nodes
 
 
+def read_manifest(manifest_path):
+    """reads the jobs of a batch run from a csv with path and start_id
+    columns
+
+    Relative paths are resolved against the directory of the manifest.
+
+    Returns:
+        jobs (list)  :  (file_path, start_node_id) pairs
+    """
+    manifest = pd.read_csv(manifest_path, dtype=str,
+                           skipinitialspace=True).loc[:, ["path", "start_id"]]
+    manifest_dir = os.path.dirname(manifest_path)
+    jobs = [(os.path.join(manifest_dir, path), start_id)
+            for path, start_id in manifest.itertuples(index=False)]
+    return jobs
+
+
 def output_file_path(input_file_path, output_format=None):
     """appends '_spiralsorted' to the input file name
 
@@ -66,15 +309,153 @@ def animation_name(input_file_path):
     return ani_name
 
 
-def write_output(sorted_nodes, output_file):
+def profile_name(input_file_path, extension):
+    """creates the name of a profile file (.pstats, .folded) at the
+    input_file_path"""
+    head, _ = os.path.splitext(input_file_path)
+    return head + "_profile" + extension
+
+
+def _output_format(output_file):
+    """the format and the compression (.gz, .zst or None) of an output
+    file"""
+    head, output_format = os.path.splitext(output_file)
+    if output_format not in CSV_COMPRESSIONS:
+        return output_format, None
+    compression = output_format
+    _, output_format = os.path.splitext(head)
+    if output_format != ".csv":
+        raise ValueError(f"only csv outputs can be compressed, not"
+                         f" {output_file}")
+    return output_format, compression
+
+
+def _gzip_member(data):
+    """data as a gzip member, with a zero mtime, so that the output is
+    reproducible (gzip.compress has no mtime before python 3.8)"""
+    buffer = BytesIO()
+    with gzip.GzipFile(fileobj=buffer, mode="wb", compresslevel=6,
+                       mtime=0) as fw:
+        fw.write(data)
+    return buffer.getvalue()
+
+
+def _compressor(compression):
+    """the bytes -> bytes function that compresses a csv chunk into a
+    gzip member or a zstd frame (None for no compression)"""
+    if compression is None:
+        return None
+    if compression == ".gz":
+        return _gzip_member
+    try:
+        import zstandard
+    except ModuleNotFoundError:
+        raise ModuleNotFoundError("Writing .zst files requires zstandard.")
+    return lambda data: zstandard.ZstdCompressor(level=3).compress(data)
+
+
+def write_csv_chunks(chunks, output_file, threads=None):
+    """writes DataFrame chunks into a csv, gzip or zstd compressed for
+    .csv.gz or .csv.zst output files
+
+    Each chunk is compressed on its own, into a gzip member or a zstd
+    frame, by a pool of threads (zlib and zstd release the GIL), while
+    the next chunks are being formatted. Concatenated members (frames)
+    make a valid gzip (zstd) file.
+
+    Args:
+        chunks (iterable)  :  DataFrames, written with their index and
+                              the header of the first one
+        output_file (str)
+        threads (int)      :  the compressing threads (default all cores)
+    """
+    _, compression = _output_format(output_file)
+    compress = _compressor(compression)
+    threads = threads or os.cpu_count()
+    with open(output_file, "wb") as f, \
+         ThreadPoolExecutor(threads) as executor:
+        pending = deque()
+        for i, chunk in enumerate(chunks):
+            data = chunk.to_csv(header=i == 0).encode()
+            if compress is None:
+                f.write(data)
+                continue
+            pending.append(executor.submit(compress, data))
+            # bound the chunks held in memory
+            while len(pending) > 2 * threads:
+                f.write(pending.popleft().result())
+        while pending:
+            f.write(pending.popleft().result())
+
+
+def _write_arrow(sorted_nodes, output_file):
+    """writes a parquet or feather (arrow ipc) file"""
+    try:
+        import pyarrow as pa
+        from pyarrow import feather, parquet
+    except ModuleNotFoundError:
+        raise ModuleNotFoundError("Writing parquet and feather files"
+                                  " requires pyarrow.")
+    table = pa.Table.from_pandas(sorted_nodes, preserve_index=False)
+    if output_file.endswith(".parquet"):
+        parquet.write_table(table, output_file)
+    else:
+        feather.write_feather(table, output_file)
+
+
+def _write_npy(sorted_nodes, output_file):
+    """writes a structured .npy, with a fixed-width unicode node_id field
+    and a field per column (object columns are stored as strings)"""
+    columns = {}
+    for column in sorted_nodes.columns:
+        values = np.asarray(sorted_nodes[column])
+        columns[str(column)] = values.astype(str) if values.dtype == object \
+            else values
+    nodes = np.empty(len(sorted_nodes),
+                     dtype=[(column, values.dtype)
+                            for column, values in columns.items()])
+    for column, values in columns.items():
+        nodes[column] = values
+    np.save(output_file, nodes)
+
+
+def write_output(sorted_nodes, output_file, threads=None):
     """writes the sorted point-cloud into a file
-    (suported formats: csv, json, xlsx)"""
-    _, format = os.path.splitext(output_file)
+    (suported formats: csv, csv.gz, csv.zst, parquet, feather, npy, json,
+    xlsx)
+
+    csv files are written in chunks of config.WRITE_CHUNK nodes,
+    compressed by threads for .csv.gz and .csv.zst outputs. parquet and
+    feather need pyarrow and .csv.zst needs zstandard.
+
+    Args:
+        sorted_nodes (df)
+        output_file (str)
+        threads (int)      :  the threads compressing a csv
+                              (default all cores)
+    """
+    output_format, _ = _output_format(output_file)
+
+    if output_format == ".csv":
+        write_csv_chunks(
+            (sorted_nodes.iloc[row_start:row_start + config.WRITE_CHUNK]
+             for row_start in range(0, max(len(sorted_nodes), 1),
+                                    config.WRITE_CHUNK)),
+            output_file,
+            threads
+        )
+        return
+    if (output_format == ".xlsx") and (len(sorted_nodes) > XLSX_MAX_ROWS):
+        raise ValueError(f"an xlsx sheet holds up to {XLSX_MAX_ROWS} nodes;"
+                         f" use csv, parquet, feather or npy")
 
     write_file = {
+        ".parquet": lambda f: _write_arrow(sorted_nodes, f),
+        ".feather": lambda f: _write_arrow(sorted_nodes, f),
+        ".arrow": lambda f: _write_arrow(sorted_nodes, f),
+        ".npy": lambda f: _write_npy(sorted_nodes, f),
         ".json": sorted_nodes.to_json,
-        ".csv": sorted_nodes.to_csv,
         ".xlsx": sorted_nodes.to_excel
     }
 
-    write_file[format](output_file)
+    write_file[output_format](output_file)
@@ -0,0 +1,117 @@
+# profiling.py is part of SpiralSort
+#
+# SpiralSort is free software; you may redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version. You should have received a copy of the GNU
+# General Public License along with this program. If not, see
+# <https://www.gnu.org/licenses/>.
+#
+# (C) 2020 Athanasios Mattas
+# ======================================================================
+"""Profiles a run, without any source edits.
+
+Two reports are taken at once, of the calling thread:
+- a cProfile (deterministic) profile, dumped as a pstats file (for
+  python -m pstats, snakeviz, etc)
+- a sampling profile of the whole call stacks, every interval seconds,
+  dumped as collapsed stacks ("root;...;leaf count" lines, for
+  flamegraph.pl, speedscope, etc), since cProfile keeps only the caller
+  and callee pairs
+
+The numba kernels are seen by their python callers, as they run
+compiled.
+"""
+
+from collections import Counter, namedtuple
+from contextlib import contextmanager
+import cProfile
+import os
+import pstats
+import sys
+import threading
+
+
+# a row of the top functions table
+FunctionStats = namedtuple("FunctionStats",
+                           ["name", "ncalls", "tottime", "cumtime"])
+
+
+def _frame_label(frame):
+    """module:function of a frame"""
+    return f"{frame.f_globals.get('__name__', '?')}:{frame.f_code.co_name}"
+
+
+def _sample_stacks(thread_id, interval, stop, stacks):
+    """counts the call stacks of the thread, every interval seconds, until
+    stop is set"""
+    while not stop.wait(interval):
+        frame = sys._current_frames().get(thread_id)
+        labels = []
+        while frame is not None:
+            labels.append(_frame_label(frame))
+            frame = frame.f_back
+        if labels:
+            stacks[";".join(reversed(labels))] += 1
+
+
+def write_collapsed(stacks, output_file):
+    """writes the stack counts as collapsed stacks, one per line"""
+    with open(output_file, 'w') as fw:
+        for stack, samples in sorted(stacks.items()):
+            fw.write(f"{stack} {samples}\n")
+
+
+@contextmanager
+def profiled(pstats_file, collapsed_file, interval=0.005):
+    """profiles the calling thread, for the lifetime of the context
+
+    Args:
+        pstats_file (str)     :  where the cProfile stats are dumped
+        collapsed_file (str)  :  where the collapsed stacks are written
+        interval (float)      :  seconds between the stack samples
+                                 (default 0.005)
+
+    Yields:
+        profiler (Profile)
+    """
+    stacks = Counter()
+    stop = threading.Event()
+    sampler = threading.Thread(target=_sample_stacks,
+                               args=(threading.get_ident(), interval, stop,
+                                     stacks),
+                               daemon=True)
+    profiler = cProfile.Profile()
+    sampler.start()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        stop.set()
+        sampler.join()
+        profiler.dump_stats(pstats_file)
+        write_collapsed(stacks, collapsed_file)
+
+
+def top_functions(pstats_file, module, num_functions=10):
+    """the functions of a module that took the most time, by their own
+    time (without the time of the functions they called)
+
+    Args:
+        pstats_file (str)
+        module (module)       :  e.g. spiralsort.core
+        num_functions (int)   :  (default 10)
+
+    Returns:
+        top (list)            :  FunctionStats
+    """
+    module_file = os.path.normcase(os.path.abspath(module.__file__))
+    rows = [
+        FunctionStats(name, ncalls, tottime, cumtime)
+        for (filename, _, name), (_, ncalls, tottime, cumtime, _)
+        in pstats.Stats(pstats_file).stats.items()
+        if os.path.normcase(os.path.abspath(filename)) == module_file
+    ]
+    rows.sort(key=lambda row: row.tottime, reverse=True)
+    return rows[:num_functions]
@@ -0,0 +1,116 @@
+# shared.py is part of SpiralSort
+#
+# SpiralSort is free software; you may redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version. You should have received a copy of the GNU
+# General Public License along with this program. If not, see
+# <https://www.gnu.org/licenses/>.
+#
+# (C) 2020 Athanasios Mattas
+# ======================================================================
+"""Shares the point-cloud arrays with worker processes, zero-copy.
+
+The arrays are stored at memory-mapped files, under /dev/shm (shared
+memory) where there is one, else under the system's temp dir. Workers
+receive SharedArray handles, which pickle to a few bytes, and attach
+the arrays by mapping the same pages, instead of unpickling copies of
+them. Results are written by the workers into shared buffers, the same
+way.
+"""
+
+from collections import namedtuple
+from contextlib import contextmanager
+import os
+import tempfile
+
+import numpy as np
+
+from spiralsort import utils
+
+
+# where the shared arrays are stored, if it exists
+SHM_DIR = "/dev/shm"
+
+# a picklable reference to a shared array
+SharedArray = namedtuple("SharedArray", ["path", "shape", "dtype"])
+
+
+def attach(handle, mode="r+"):
+    """the array of a SharedArray handle, memory-mapped (zero-copy)
+
+    Writes through a r+ array are seen by every process that attached
+    it.
+    """
+    if not np.prod(handle.shape):
+        # empty files can't be mapped
+        return np.empty(handle.shape, dtype=handle.dtype)
+    return np.memmap(handle.path, dtype=handle.dtype, mode=mode,
+                     shape=handle.shape)
+
+
+def _create(store_dir, name, shape, dtype):
+    """a zero-filled shared array at the store_dir"""
+    handle = SharedArray(os.path.join(store_dir, name + ".bin"),
+                         tuple(shape), np.dtype(dtype).str)
+    if np.prod(handle.shape):
+        np.memmap(handle.path, dtype=handle.dtype, mode="w+",
+                  shape=handle.shape).flush()
+    return handle
+
+
+@contextmanager
+def shared_arrays(arrays, buffers=None, store_dir=None):
+    """stores the arrays and allocates the buffers as shared arrays, for
+    the lifetime of the context
+
+    Args:
+        arrays (dict)     :  name -> array, copied into the store
+        buffers (dict)    :  name -> (shape, dtype), zero-filled
+                             (default None)
+        store_dir (str)   :  where the store is kept (default /dev/shm,
+                             if it exists, else the system's temp dir)
+
+    Yields:
+        handles (dict)    :  name -> SharedArray
+    """
+    if (store_dir is None) and os.path.isdir(SHM_DIR):
+        store_dir = SHM_DIR
+    with tempfile.TemporaryDirectory(prefix="spiralsort_",
+                                     dir=store_dir) as store_dir:
+        handles = {}
+        for name, array in arrays.items():
+            array = np.asarray(array)
+            handles[name] = _create(store_dir, name, array.shape,
+                                    array.dtype)
+            if array.size:
+                shared = attach(handles[name])
+                shared[...] = array
+                shared.flush()
+        for name, (shape, dtype) in (buffers or {}).items():
+            handles[name] = _create(store_dir, name, shape, dtype)
+        yield handles
+
+
+@contextmanager
+def shared_cloud(nodes_input, num_orders=1, store_dir=None):
+    """shares the float32 x, y, z columns and the node_id codes of the
+    point-cloud, along with int64 permutation buffers for the results
+
+    Args:
+        nodes_input (df)   :  the point-cloud
+        num_orders (int)   :  the rows of the order buffer (default 1)
+        store_dir (str)    :  see shared_arrays
+
+    Yields:
+        handles (dict)     :  SharedArrays of x, y, z, node_code (int32,
+                              see utils.intern_ids) and order, a
+                              (num_orders, num_nodes) int64 buffer
+    """
+    codes, _ = utils.intern_ids(nodes_input["node_id"])
+    arrays = {axis: nodes_input[axis].to_numpy(np.float32)
+              for axis in ('x', 'y', 'z')}
+    arrays["node_code"] = codes
+    buffers = {"order": ((num_orders, len(codes)), np.int64)}
+    with shared_arrays(arrays, buffers, store_dir) as handles:
+        yield handles
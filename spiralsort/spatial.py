@@ -0,0 +1,365 @@
+# spatial.py is part of SpiralSort
+#
+# SpiralSort is free software; you may redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version. You should have received a copy of the GNU
+# General Public License along with this program. If not, see
+# <https://www.gnu.org/licenses/>.
+#
+# (C) 2020 Athanasios Mattas
+# ======================================================================
+"""Houses a uniform voxel grid, used to select the spiral_window."""
+
+from collections import namedtuple
+
+import numba as nb
+import numpy as np
+
+from spiralsort import config
+
+
+# lo (array)            :  the lower corner of the grid
+# cell_size (float)     :  the edge of the (cubic) cells
+# dims (array)          :  number of cells along x, y, z
+# block (int)           :  edge of the blocks of cells, in cells
+# block_dims (array)    :  number of blocks along x, y, z
+# cell_start (array)    :  nodes of cell c are cell_nodes[cell_start[c]:
+#                          cell_start[c + 1]]
+# cell_nodes (array)    :  the nodes, grouped by cell, in ascending order
+#                          inside each cell
+# node_cells (array)    :  the cell of each node
+# cell_active (array)   :  number of active nodes per cell
+# block_active (array)  :  number of active nodes per block
+VoxelGrid = namedtuple("VoxelGrid",
+                       ["lo", "cell_size", "dims", "block", "block_dims",
+                        "cell_start", "cell_nodes", "node_cells",
+                        "cell_active", "block_active"])
+
+
+def _grid_dims(extents, cell_size):
+    """number of cells along each axis, for the given cell_size"""
+    return np.maximum(np.ceil(extents / cell_size), 1).astype(np.int64)
+
+
+def build_grid(nodes_x, nodes_y, nodes_z,
+               nodes_per_cell=config.GRID_NODES_PER_CELL,
+               block=config.GRID_BLOCK):
+    """builds a uniform voxel grid over the point-cloud
+
+    The cell_size is selected, such that there are about nodes_per_cell
+    nodes per cell, for a uniformly distributed cloud. Flat (2D) clouds
+    get a single layer of cells. Cells are grouped into blocks of
+    block ** 3 cells, so that large regions without active nodes are
+    skipped at once. All the nodes start inactive.
+
+    Args:
+        nodes_x, nodes_y, nodes_z (array) :  the point-cloud
+        nodes_per_cell (int)              :  (default 8)
+        block (int)                       :  (default 8)
+
+    Returns:
+        grid (VoxelGrid)
+    """
+    num_nodes = len(nodes_x)
+    coords = np.stack([nodes_x, nodes_y, nodes_z]).astype(np.float64)
+    lo = coords.min(axis=1)
+    extents = coords.max(axis=1) - lo
+    num_cells = max(num_nodes // nodes_per_cell, 1)
+
+    # bisect the cell_size, so that the number of cells meets num_cells
+    low, high = extents.max() / num_cells, extents.max()
+    if high == 0:
+        cell_size = 1.
+    else:
+        for _ in range(50):
+            cell_size = (low + high) / 2
+            if np.prod(_grid_dims(extents, cell_size)) > num_cells:
+                low = cell_size
+            else:
+                high = cell_size
+        cell_size = high
+    dims = _grid_dims(extents, cell_size)
+    block_dims = -(-dims // block)
+
+    cell_xyz = np.minimum(
+        ((coords - lo[:, None]) / cell_size).astype(np.int64),
+        dims[:, None] - 1
+    )
+    node_cells = (cell_xyz[0] * dims[1] + cell_xyz[1]) * dims[2] + cell_xyz[2]
+    cell_start = np.zeros(np.prod(dims) + 1, dtype=np.int64)
+    cell_start[1:] = np.cumsum(np.bincount(node_cells,
+                                           minlength=np.prod(dims)))
+    cell_nodes = np.argsort(node_cells, kind="mergesort").astype(np.int64)
+    return VoxelGrid(lo, float(cell_size), dims, block, block_dims,
+                     cell_start, cell_nodes, node_cells,
+                     np.zeros(np.prod(dims), dtype=np.int64),
+                     np.zeros(np.prod(block_dims), dtype=np.int64))
+
+
+@nb.njit(nb.void(nb.i8[:], nb.i8[:], nb.i8, nb.i8[:], nb.i8[:], nb.i8[:],
+                 nb.i8[:], nb.i8),
+         cache=True, nogil=True)
+def _update_active_numpy(nodes, node_cells, block, dims, block_dims,
+                         cell_active, block_active, delta):
+    """numba kernel of activate and deactivate"""
+    for node in nodes:
+        cell = node_cells[node]
+        iz = cell % dims[2]
+        iy = (cell // dims[2]) % dims[1]
+        ix = cell // (dims[2] * dims[1])
+        cell_active[cell] += delta
+        block_active[((ix // block) * block_dims[1] + iy // block)
+                     * block_dims[2] + iz // block] += delta
+
+
+def activate(grid, nodes):
+    """counts nodes as active (e.g. the nodes of a new slice)"""
+    _update_active_numpy(nodes, grid.node_cells, grid.block, grid.dims,
+                         grid.block_dims, grid.cell_active, grid.block_active,
+                         1)
+
+
+def deactivate(grid, nodes):
+    """stops counting nodes as active (e.g. the popped nodes)"""
+    _update_active_numpy(nodes, grid.node_cells, grid.block, grid.dims,
+                         grid.block_dims, grid.cell_active, grid.block_active,
+                         -1)
+
+
+@nb.njit(nb.f8(nb.f8[:], nb.f8, nb.i8, nb.i8, nb.i8, nb.i8, nb.f8[:]),
+         cache=True, nogil=True)
+def _box_distance(lo, cell_size, ix, iy, iz, size, point):
+    """distance of a point from the box of size ** 3 cells, with lower
+    cell (ix, iy, iz) (0 if inside)"""
+    distance = 0.
+    for axis, i in ((0, ix), (1, iy), (2, iz)):
+        box_lo = lo[axis] + i * cell_size
+        box_hi = box_lo + size * cell_size
+        if point[axis] < box_lo:
+            distance += (box_lo - point[axis]) ** 2
+        elif point[axis] > box_hi:
+            distance += (point[axis] - box_hi) ** 2
+    return np.sqrt(distance)
+
+
+@nb.njit(nb.i8(nb.f4[:], nb.f4[:], nb.f4[:], nb.f4[:], nb.b1[:], nb.i8,
+               nb.i8[:], nb.i8[:], nb.i8, nb.f4, nb.f4, nb.f4, nb.f8,
+               nb.i8[:], nb.f4[:], nb.i8),
+         cache=True, nogil=True)
+def _collect_cell(nodes_x, nodes_y, nodes_z, nodes_d, alive, stop,
+                  cell_start, cell_nodes, cell, prev_x, prev_y, prev_z,
+                  max_cost, candidates, costs, num_candidates):
+    """appends the active nodes of a cell, that cost up to max_cost, and
+    their cost to candidates
+
+    Returns:
+        num_candidates (int)  :  -1 if candidates run out of capacity
+    """
+    for i in range(cell_start[cell], cell_start[cell + 1]):
+        node = cell_nodes[i]
+        # nodes of a cell are in ascending order
+        if node >= stop:
+            break
+        if not alive[node]:
+            continue
+        dx = nodes_x[node] - prev_x
+        dy = nodes_y[node] - prev_y
+        dz = nodes_z[node] - prev_z
+        cost = nodes_d[node] + np.sqrt(dx * dx + dy * dy + dz * dz)
+        if cost > max_cost:
+            continue
+        if num_candidates == len(candidates):
+            return -1
+        candidates[num_candidates] = node
+        costs[num_candidates] = cost
+        num_candidates += 1
+    return num_candidates
+
+
+@nb.njit(nb.i8[:](nb.f4[:], nb.f4[:], nb.f4[:], nb.f4[:], nb.b1[:], nb.i8,
+                  nb.f8[:], nb.f8, nb.i8[:], nb.i8, nb.i8[:],
+                  nb.i8[:], nb.i8[:], nb.i8[:], nb.i8[:],
+                  nb.f4, nb.f4, nb.f4, nb.i8),
+         cache=True, nogil=True)
+def _grid_window_numpy(nodes_x, nodes_y, nodes_z, nodes_d, alive, stop,
+                       lo, cell_size, dims, block, block_dims,
+                       cell_start, cell_nodes, cell_active, block_active,
+                       prev_x, prev_y, prev_z, spiral_window):
+    """numba kernel of grid_window
+
+    1. Visit the cells around the prev_node, until spiral_window
+       candidates are collected. Their spiral_window-th cost, kth_cost,
+       bounds the cost of the final spiral_window.
+    2. A node with cost <= kth_cost lies in the ellipsoid with foci the
+       start_node and the prev_node, whose distances sum to kth_cost.
+       Visit the rest of the blocks and the cells in the bounding box of
+       the ellipsoid, skipping the ones without active nodes or that
+       cannot hold a node cheaper than kth_cost.
+    """
+    # float32 costs may round slightly below the exact lower bounds
+    slack = 1 + 1e-5
+
+    capacity = max(4 * spiral_window, 1024)
+    candidates = np.empty(capacity, dtype=np.int64)
+    costs = np.empty(capacity, dtype=np.float32)
+    num_candidates = 0
+    origin = np.zeros(3, dtype=np.float64)
+    prev_xyz = np.array([prev_x, prev_y, prev_z], dtype=np.float64)
+    prev_cell = np.minimum(
+        np.maximum(((prev_xyz - lo) // cell_size).astype(np.int64), 0),
+        dims - 1
+    )
+
+    # 1. neighborhood of the prev_node
+    radius = -1
+    box_lo = np.zeros(3, dtype=np.int64)
+    box_hi = dims - 1
+    while (num_candidates < spiral_window) and (radius < block):
+        radius += 1
+        for ix in range(max(prev_cell[0] - radius, 0),
+                        min(prev_cell[0] + radius, dims[0] - 1) + 1):
+            for iy in range(max(prev_cell[1] - radius, 0),
+                            min(prev_cell[1] + radius, dims[1] - 1) + 1):
+                for iz in range(max(prev_cell[2] - radius, 0),
+                                min(prev_cell[2] + radius, dims[2] - 1) + 1):
+                    if max(abs(ix - prev_cell[0]), abs(iy - prev_cell[1]),
+                           abs(iz - prev_cell[2])) != radius:
+                        continue
+                    cell = (ix * dims[1] + iy) * dims[2] + iz
+                    if cell_active[cell] == 0:
+                        continue
+                    collected = -1
+                    while collected < 0:
+                        collected = _collect_cell(
+                            nodes_x, nodes_y, nodes_z, nodes_d, alive, stop,
+                            cell_start, cell_nodes, cell,
+                            prev_x, prev_y, prev_z, np.inf,
+                            candidates, costs, num_candidates)
+                        if collected < 0:
+                            capacity *= 2
+                            grown = np.empty(capacity, dtype=np.int64)
+                            grown[:num_candidates] = \
+                                candidates[:num_candidates]
+                            candidates = grown
+                            grown_costs = np.empty(capacity,
+                                                   dtype=np.float32)
+                            grown_costs[:num_candidates] = \
+                                costs[:num_candidates]
+                            costs = grown_costs
+                    num_candidates = collected
+
+    # 2. bounding box of the ellipsoid
+    kth_cost = np.inf
+    if num_candidates >= spiral_window:
+        kth_cost = np.float64(
+            np.partition(costs[:num_candidates],
+                         spiral_window - 1)[spiral_window - 1]
+        ) * slack
+        focal = np.sqrt((prev_xyz ** 2).sum())
+        semi_major = kth_cost / 2
+        semi_minor_2 = max(semi_major ** 2 - (focal / 2) ** 2, 0.)
+        for axis in range(3):
+            u_2 = (prev_xyz[axis] / focal) ** 2 if focal > 0 else 0.
+            half_extent = np.sqrt(semi_major ** 2 * u_2
+                                  + semi_minor_2 * (1 - u_2))
+            center = prev_xyz[axis] / 2
+            box_lo[axis] = max(
+                int((center - half_extent - lo[axis]) // cell_size), 0)
+            box_hi[axis] = min(
+                int((center + half_extent - lo[axis]) // cell_size),
+                dims[axis] - 1)
+
+    for bx in range(box_lo[0] // block, box_hi[0] // block + 1):
+        for by in range(box_lo[1] // block, box_hi[1] // block + 1):
+            for bz in range(box_lo[2] // block, box_hi[2] // block + 1):
+                if block_active[(bx * block_dims[1] + by)
+                                * block_dims[2] + bz] == 0:
+                    continue
+                if (_box_distance(lo, cell_size, bx * block, by * block,
+                                  bz * block, block, origin)
+                        + _box_distance(lo, cell_size, bx * block, by * block,
+                                        bz * block, block, prev_xyz)
+                        > kth_cost):
+                    continue
+
+                for ix in range(max(bx * block, box_lo[0]),
+                                min((bx + 1) * block - 1, box_hi[0]) + 1):
+                    for iy in range(max(by * block, box_lo[1]),
+                                    min((by + 1) * block - 1, box_hi[1]) + 1):
+                        for iz in range(max(bz * block, box_lo[2]),
+                                        min((bz + 1) * block - 1,
+                                            box_hi[2]) + 1):
+                            # already visited at the neighborhood
+                            if max(abs(ix - prev_cell[0]),
+                                   abs(iy - prev_cell[1]),
+                                   abs(iz - prev_cell[2])) <= radius:
+                                continue
+                            cell = (ix * dims[1] + iy) * dims[2] + iz
+                            if cell_active[cell] == 0:
+                                continue
+                            if (_box_distance(lo, cell_size, ix, iy, iz, 1,
+                                              origin)
+                                    + _box_distance(lo, cell_size, ix, iy,
+                                                    iz, 1, prev_xyz)
+                                    > kth_cost):
+                                continue
+                            collected = -1
+                            while collected < 0:
+                                collected = _collect_cell(
+                                    nodes_x, nodes_y, nodes_z, nodes_d,
+                                    alive, stop, cell_start, cell_nodes,
+                                    cell, prev_x, prev_y, prev_z, kth_cost,
+                                    candidates, costs, num_candidates)
+                                if collected < 0:
+                                    capacity *= 2
+                                    grown = np.empty(capacity,
+                                                     dtype=np.int64)
+                                    grown[:num_candidates] = \
+                                        candidates[:num_candidates]
+                                    candidates = grown
+                                    grown_costs = np.empty(capacity,
+                                                           dtype=np.float32)
+                                    grown_costs[:num_candidates] = \
+                                        costs[:num_candidates]
+                                    costs = grown_costs
+                            num_candidates = collected
+
+    # cost-sort the candidates, breaking ties by position
+    candidates = candidates[:num_candidates]
+    costs = costs[:num_candidates]
+    by_position = np.argsort(candidates)
+    candidates = candidates[by_position]
+    costs = costs[by_position]
+    by_cost = np.argsort(costs, kind="mergesort")
+    return candidates[by_cost[:spiral_window]]
+
+
+def grid_window(grid, cloud, alive, stop, prev_xyz, spiral_window):
+    """selects the spiral_window active nodes with the lowest cost from
+    the prev_node
+
+    cost = |node - start| + |node - prev_node|
+
+    Only the cells around the prev_node and the ones that can hold a
+    node of the spiral_window are visited, so the cost of a call depends
+    on the spiral_window and not on the size of the slice.
+
+    Args:
+        grid (VoxelGrid)     :  built over the cloud
+        cloud (tuple)        :  x, y, z, |node - start|, theta
+        alive (array)        :  the live mask of the cloud
+        stop (int)           :  nodes at positions >= stop are inactive
+        prev_xyz (tuple)     :  coordinates of the last popped node
+        spiral_window (int)
+
+    Returns:
+        window (array)       :  the positions of the selected nodes,
+                                cost-sorted (ties by position)
+    """
+    return _grid_window_numpy(*cloud[:4], alive, stop,
+                              grid.lo, grid.cell_size, grid.dims,
+                              grid.block, grid.block_dims,
+                              grid.cell_start, grid.cell_nodes,
+                              grid.cell_active, grid.block_active,
+                              *prev_xyz, spiral_window)
@@ -11,15 +11,23 @@
 # ======================================================================
 """Houses all the tests."""
 
+import gzip
+import json
 import os
+import pickle
+import subprocess
+import sys
 
+from click.testing import CliRunner
 import numpy as np
 import pandas as pd
 from pandas.testing import assert_frame_equal, assert_index_equal
 import pytest
 import time
 
-from spiralsort import core, io, utils
+from spiralsort import (config, core, external, generators, io, profiling,
+                        shared, spatial, stats, utils)
+from spiralsort.__main__ import main
 from spiralsort.utils import time_this
 
 
@@ -39,6 +47,15 @@ class TestCore:
                                                        prev_node_mock)
         assert_index_equal(index_expected, index_filtered)
 
+        # with the precomputed angles
+        nodes_mock = nodes_mock.astype(np.float32)
+        nodes_mock["theta"] = core._xy_angle_numpy(nodes_mock.x.values,
+                                                   nodes_mock.y.values)
+        prev_node_mock["theta"] = np.arctan2(np.float32(1), np.float32(2))
+        index_filtered = core._counterclockwise_filter(nodes_mock,
+                                                       prev_node_mock)
+        assert_index_equal(index_expected, index_filtered)
+
     def test_spiralsorted(self):
         spiralsorted_expected = pd.DataFrame(
             {
@@ -86,6 +103,431 @@ class TestCore:
         assert_frame_equal(spiralsorted_expected,
                            spiralsorted_result.iloc[:, [0, 1, 2, 3]])
 
+        spiralsorted_result = core.spiralsorted(
+            nodes_input=nodes_mock,
+            start_node_id=spiralsorted_expected.loc[0, "node_id"],
+            engine="numpy"
+        )
+        assert_frame_equal(spiralsorted_expected,
+                           spiralsorted_result.iloc[:, [0, 1, 2, 3]],
+                           check_dtype=False)
+
+        for engine in core.ENGINES:
+            order = core.spiralsorted(
+                nodes_input=nodes_mock,
+                start_node_id=spiralsorted_expected.loc[0, "node_id"],
+                engine=engine,
+                return_order=True
+            )
+            assert order.dtype == np.int64
+            assert_frame_equal(spiralsorted_expected,
+                               nodes_mock.iloc[order].reset_index(drop=True))
+
+    def test_spiralsorted_numpy_engine(self):
+        data_dir = os.path.join("examples", "data_examples")
+        nodes = io.read_data_file(
+            os.path.join(data_dir, "point_cloud_example.csv"))
+        spiralsorted_expected = io.read_data_file(
+            os.path.join(data_dir, "point_cloud_example_spiralsorted.csv"))
+        spiralsorted_result = core.spiralsorted(nodes, "N_4004",
+                                                engine="numpy")
+        assert_frame_equal(spiralsorted_expected, spiralsorted_result)
+        spiralsorted_result = core.spiralsorted(nodes, "N_4004",
+                                                engine="numpy",
+                                                window_selection="grid")
+        assert_frame_equal(spiralsorted_expected, spiralsorted_result)
+
+    def test_spiralsorted_payload(self, tmp_path):
+        data_path = os.path.join("examples", "data_examples",
+                                 "point_cloud_example.csv")
+        nodes = io.read_data_file(data_path).iloc[:300]
+        nodes = nodes.assign(intensity=np.arange(300, dtype=np.uint16),
+                             label=[f"L{row % 7}" for row in range(300)])
+        file_path = str(tmp_path / "cloud.csv")
+        nodes.to_csv(file_path)
+        nodes = io.read_data_file(file_path, payload=True)
+        assert list(nodes.columns) == ["node_id", 'x', 'y', 'z',
+                                       "intensity", "label"]
+        assert list(io.read_data_file(file_path, payload=["label"]).columns) \
+            == ["node_id", 'x', 'y', 'z', "label"]
+
+        start_node_id = nodes.node_id.iloc[0]
+        order = core.spiralsorted(nodes, start_node_id, engine="numpy",
+                                  return_order=True)
+        for engine in core.ENGINES:
+            spiralsorted_result = core.spiralsorted(nodes, start_node_id,
+                                                    engine=engine)
+            assert_frame_equal(nodes.iloc[order].reset_index(drop=True),
+                               spiralsorted_result)
+
+        pytest.importorskip("pyarrow")
+        file_path = str(tmp_path / "cloud.parquet")
+        nodes.to_parquet(file_path)
+        nodes = io.read_data_file(file_path, payload=True)
+        spiralsorted_result = core.spiralsorted(nodes, start_node_id,
+                                                engine="numpy")
+        assert spiralsorted_result.label.dtype == nodes.label.dtype
+        assert spiralsorted_result.label.tolist() \
+            == nodes.label.take(order).tolist()
+
+    def test_argselect(self):
+        cost = np.array([3, 1, 2, 1, 5, 2, 2, 0, 2], dtype=np.float32)
+        for k in range(1, len(cost) + 2):
+            np.testing.assert_array_equal(
+                np.argsort(cost, kind="mergesort")[:k],
+                core._argselect(cost, k)
+            )
+
+    def test_next_node(self):
+        rng = np.random.default_rng(0)
+        x, y, z = rng.uniform(-1, 1, (3, 5000)).astype(np.float32)
+        d_start = np.sqrt(x ** 2 + y ** 2 + z ** 2)
+        theta = core._xy_angle_numpy(x, y)
+        window = rng.permutation(5000)[:4500]
+        live = rng.random(4500) < 0.5
+        prev = (x[0], y[0], z[0], theta[0])
+        cost = d_start[window] + core._distances_from_node_numpy(
+            x[window], y[window], z[window], *prev[:3])
+        counterclockwise = core._counterclockwise_mask(theta[window], prev[3])
+        candidates = np.flatnonzero(live & counterclockwise)
+        expected = candidates[np.argmin(cost[candidates])]
+        for kernel in (core._next_node_numpy, core._next_node_parallel_numpy):
+            assert kernel(x, y, z, d_start, theta, window, live, *prev)[0] \
+                == expected
+
+        # no counterclockwise node is live
+        live &= ~counterclockwise
+        candidates = np.flatnonzero(live)
+        expected = candidates[np.argmin(cost[candidates])]
+        for kernel in (core._next_node_numpy, core._next_node_parallel_numpy):
+            assert kernel(x, y, z, d_start, theta, window, live, *prev) \
+                == (-1, expected)
+
+    def test_spiralsorted_partition(self):
+        data_path = os.path.join("examples", "data_examples",
+                                 "point_cloud_example.csv")
+        # enough nodes to partition and to span 2 slices
+        nodes = io.read_data_file(data_path).iloc[:2200]
+        start_node_id = nodes.node_id.iloc[0]
+        spiralsorted_pandas = core.spiralsorted(
+            nodes, start_node_id, window_selection="partition")
+        spiralsorted_numpy = core.spiralsorted(
+            nodes, start_node_id, engine="numpy", window_selection="partition")
+        assert_frame_equal(spiralsorted_pandas, spiralsorted_numpy)
+        assert spiralsorted_numpy.node_id.is_unique
+        assert len(spiralsorted_numpy.index) == len(nodes.index)
+
+    def test_spiralsorted_limit(self):
+        data_dir = os.path.join("examples", "data_examples")
+        nodes = io.read_data_file(
+            os.path.join(data_dir, "point_cloud_example.csv"))
+        spiralsorted_expected = io.read_data_file(
+            os.path.join(data_dir, "point_cloud_example_spiralsorted.csv"))
+        for limit in (1, 2500):
+            spiralsorted_result = core.spiralsorted(nodes, "N_4004",
+                                                    engine="numpy",
+                                                    limit=limit)
+            assert_frame_equal(spiralsorted_expected.iloc[:limit],
+                               spiralsorted_result)
+        spiralsorted_result = core.spiralsorted(nodes, "N_4004", limit=1100)
+        assert_frame_equal(spiralsorted_expected.iloc[:1100],
+                           spiralsorted_result)
+        with pytest.raises(ValueError):
+            core.spiralsorted(nodes, "N_4004", limit=0)
+
+        d_start = np.array([3, 1, 2, 1, 5, 2, 2, 0, 2], dtype=np.float32)
+        for num_nearest in range(1, len(d_start) + 1):
+            selected = core._radial_select(d_start, num_nearest)
+            np.testing.assert_array_equal(
+                np.sort(np.argsort(d_start, kind="mergesort")[:num_nearest]),
+                selected
+            )
+
+    def test_spiralsort_iter(self):
+        data_path = os.path.join("examples", "data_examples",
+                                 "point_cloud_example.csv")
+        nodes = io.read_data_file(data_path).iloc[:1200]
+        start_node_id = nodes.node_id.iloc[0]
+        order = core.spiralsorted(nodes, start_node_id, engine="numpy",
+                                  return_order=True)
+        chunks = list(core.spiralsort_iter(nodes, start_node_id,
+                                           chunk_size=100))
+        assert all(len(chunk) >= 100 for chunk in chunks[:-1])
+        assert all(len(chunk) < 100 + config.STRIDE for chunk in chunks)
+        np.testing.assert_array_equal(nodes.node_id.values[order],
+                                      np.concatenate(chunks))
+        chunks = core.spiralsort_iter(nodes, start_node_id,
+                                      return_order=True)
+        assert next(chunks)[0] == order[0]
+
+    def test_radial_sort_lazy(self):
+        rng = np.random.default_rng(3)
+        # integer coordinates, for plenty of distance ties
+        nodes_xyz = tuple(rng.integers(-5, 6, 500).astype(np.float32)
+                          for _ in range(3))
+        rows_expected, cloud_expected = core._radial_sort_arrays(nodes_xyz,
+                                                                 7)
+        rows, cloud, prepare_slice = core._radial_sort_lazy(nodes_xyz, 7)
+        for stop in [10, 15, 40, 45, 200, 600]:
+            prepare_slice(slice(0, stop))
+            num_sorted = min(stop, len(rows))
+            np.testing.assert_array_equal(rows_expected[:num_sorted],
+                                          rows[:num_sorted])
+            for axis_expected, axis in zip(cloud_expected, cloud):
+                np.testing.assert_array_equal(axis_expected[:num_sorted],
+                                              axis[:num_sorted])
+
+    def test_spiralsorted_multistart(self):
+        data_path = os.path.join("examples", "data_examples",
+                                 "point_cloud_example.csv")
+        nodes = io.read_data_file(data_path).iloc[:1500]
+        start_node_ids = nodes.node_id.iloc[[0, 700, 1499]].tolist()
+        spiralsorted_results = core.spiralsorted_multistart(
+            nodes, start_node_ids, threads=2)
+        for start_node_id, spiralsorted_result in zip(start_node_ids,
+                                                      spiralsorted_results):
+            spiralsorted_expected = core.spiralsorted(nodes, start_node_id,
+                                                      engine="numpy")
+            assert_frame_equal(spiralsorted_expected, spiralsorted_result)
+        orders = core.spiralsorted_multistart(nodes, start_node_ids,
+                                              return_order=True, processes=2)
+        for order, spiralsorted_result in zip(orders, spiralsorted_results):
+            assert_frame_equal(spiralsorted_result,
+                               nodes.iloc[order].reset_index(drop=True))
+        with pytest.raises(ValueError):
+            core.spiralsorted_multistart(nodes, ["missing"])
+
+    def test_spiralsorted_sectors(self):
+        data_path = os.path.join("examples", "data_examples",
+                                 "point_cloud_example.csv")
+        nodes = io.read_data_file(data_path).iloc[:2600]
+        start_node_id = nodes.node_id.iloc[0]
+        order = core.spiralsorted_sectors(nodes, start_node_id, 4,
+                                          processes=2, parallel_from=2000,
+                                          return_order=True)
+        np.testing.assert_array_equal(np.arange(len(nodes.index)),
+                                      np.sort(order))
+        # the first slice is popped as a whole, before the sectors
+        _, rows, _ = core._radial_sort_numpy(nodes, start_node_id)
+        np.testing.assert_array_equal(np.sort(rows[:2000]),
+                                      np.sort(order[1:2001]))
+        # without far slices, the first slice is the last one
+        order = core.spiralsorted_sectors(nodes.iloc[:1500], start_node_id,
+                                          return_order=True)
+        np.testing.assert_array_equal(
+            core.spiralsorted(nodes.iloc[:1500], start_node_id,
+                              engine="numpy", return_order=True),
+            order
+        )
+
+        # a unit square, walked counterclockwise from its corner
+        nodes_mock = pd.DataFrame({"node_id": ["A", "B", "C", "D"],
+                                   'x': [0., 1., 1., 0.],
+                                   'y': [0., 0., 1., 1.],
+                                   'z': [0., 0., 0., 0.]})
+        quality = core.spiral_quality(nodes_mock, np.arange(4))
+        assert quality == (3., 1., 1.)
+        quality = core.spiral_quality(nodes_mock, np.array([0, 3, 2, 1]))
+        assert quality.counterclockwise == 0.
+        difference = core.spiral_difference(
+            nodes_mock, np.array([0, 3, 2, 1]), np.arange(4))
+        assert difference == (0., 0., -1., 1., 2)
+
+    def test_spiralsorted_many(self, tmp_path):
+        data_path = os.path.join("examples", "data_examples",
+                                 "point_cloud_example.csv")
+        nodes = io.read_data_file(data_path)
+        jobs = []
+        for name, rows in [("a", slice(0, 500)), ("b", slice(500, 800))]:
+            file_path = str(tmp_path / f"{name}.csv")
+            nodes.iloc[rows].to_csv(file_path, index=False)
+            jobs.append((file_path, nodes.node_id.iloc[rows.start]))
+        jobs.append((file_path, "missing"))
+        results = list(core.spiralsorted_many(jobs, engine="numpy",
+                                              processes=2))
+        assert len(results) == len(jobs)
+        for result in results:
+            if result.start_node_id == "missing":
+                assert result.error is not None
+                continue
+            assert result.error is None
+            spiralsorted_expected = core.spiralsorted(
+                io.read_data_file(result.file_path), result.start_node_id,
+                engine="numpy")
+            spiralsorted_result = io.read_data_file(result.output_file)
+            assert_frame_equal(spiralsorted_expected, spiralsorted_result)
+
+
+class TestSpatial:
+    """spatial.py tests"""
+
+    def test_grid_window(self):
+        rng = np.random.default_rng(4)
+        nodes_x, nodes_y, nodes_z = rng.random((3, 3000), dtype=np.float32)
+        nodes_d = np.sqrt(nodes_x ** 2 + nodes_y ** 2 + nodes_z ** 2)
+        cloud = (nodes_x, nodes_y, nodes_z, nodes_d)
+        alive = rng.random(3000) > 0.3
+        stop = 2500
+        grid = spatial.build_grid(nodes_x, nodes_y, nodes_z)
+        spatial.activate(grid, np.flatnonzero(alive[:stop]))
+        prev_xyz = (nodes_x[7], nodes_y[7], nodes_z[7])
+
+        active = np.flatnonzero(alive[:stop])
+        cost = nodes_d[active] + np.sqrt(
+            (nodes_x[active] - prev_xyz[0]) ** 2
+            + (nodes_y[active] - prev_xyz[1]) ** 2
+            + (nodes_z[active] - prev_xyz[2]) ** 2
+        )
+        window_expected = active[np.argsort(cost, kind="mergesort")[:300]]
+        window = spatial.grid_window(grid, cloud, alive, stop, prev_xyz, 300)
+        np.testing.assert_array_equal(window_expected, window)
+
+
+class TestExternal:
+    """external.py tests"""
+
+    def test_spiralsorted_file(self, tmp_path):
+        data_dir = os.path.join("examples", "data_examples")
+        spiralsorted_expected = io.read_data_file(
+            os.path.join(data_dir, "point_cloud_example_spiralsorted.csv"))
+        # chunks smaller than the cloud, to merge several runs
+        output_file = external.spiralsorted_file(
+            os.path.join(data_dir, "point_cloud_example.csv"), "N_4004",
+            str(tmp_path / "result.csv"), work_dir=str(tmp_path),
+            chunk_size=700)
+        assert_frame_equal(spiralsorted_expected,
+                           io.read_data_file(output_file))
+
+
+class TestGenerators:
+    """generators.py tests"""
+
+    def test_point_cloud(self):
+        for family in generators.FAMILIES:
+            nodes = generators.point_cloud(family, 1000, seed=2)
+            assert_frame_equal(nodes,
+                               generators.point_cloud(family, 1000, seed=2))
+            assert list(nodes.columns) == io.NODE_COLUMNS
+            assert (nodes.node_id.values == np.arange(1000).astype(str)).all()
+            assert (nodes[['x', 'y', 'z']].dtypes == np.float32).all()
+        shell = generators.point_cloud("shell", 1000, seed=2,
+                                       inner_radius=0.5)
+        radii = np.linalg.norm(shell[['x', 'y', 'z']].values, axis=1)
+        assert (radii > 0.5 - 1e-6).all() and (radii < 1 + 1e-6).all()
+        duplicates = generators.point_cloud("duplicates", 1000, seed=2)
+        assert duplicates.duplicated(['x', 'y', 'z']).any()
+        chunks = list(generators.point_cloud_chunks("clusters", 2500, seed=2,
+                                                    chunk_size=1000))
+        assert [len(chunk) for chunk in chunks] == [1000, 1000, 500]
+        assert_index_equal(pd.concat(chunks).index, pd.RangeIndex(2500))
+        with pytest.raises(ValueError):
+            generators.point_cloud("cube", 10)
+
+    def test_write_point_cloud(self, tmp_path):
+        formats = ["csv", "npy", "ply"]
+        try:
+            import pyarrow  # noqa: F401
+            formats += ["parquet", "feather"]
+        except ModuleNotFoundError:
+            pass
+        expected = pd.concat(generators.point_cloud_chunks(
+            "gradient", 2500, seed=2, chunk_size=1000
+        )).reset_index(drop=True)
+        for output_format in formats:
+            output_file = str(tmp_path / f"cloud.{output_format}")
+            generators.write_point_cloud(output_file, "gradient", 2500,
+                                         seed=2, chunk_size=1000)
+            assert_frame_equal(io.read_data_file(output_file), expected)
+        with pytest.raises(ValueError):
+            generators.write_point_cloud(str(tmp_path / "cloud.json"),
+                                         "gradient", 10)
+
+
+class TestStats:
+    """stats.py tests"""
+
+    def test_collecting(self, tmp_path):
+        # free when disabled: nothing is recorded
+        stats.count("strides")
+        with stats.phase("radial"):
+            pass
+        with stats.collecting() as collected:
+            with stats.phase("radial"):
+                stats.count("strides")
+                stats.count("pops", 15)
+                for value in (400, 14, 500):
+                    stats.sample("window_size", value)
+        assert list(collected.phases) == ["radial"]
+        assert collected.counters == {"strides": 1, "pops": 15}
+        assert collected.samples["window_size"] == {
+            "count": 3, "total": 914, "min": 14, "max": 500}
+        assert collected.peak_rss["radial"] > 0
+        stats_file = str(tmp_path / "stats.json")
+        stats.to_json(collected, stats_file)
+        with open(stats_file) as fr:
+            assert json.load(fr)["counters"] == collected.counters
+
+    def test_spiralsorted_stats(self):
+        data_path = os.path.join("examples", "data_examples",
+                                 "point_cloud_example.csv")
+        nodes = io.read_data_file(data_path).iloc[:1200]
+        start_node_id = nodes.node_id.iloc[0]
+        counters = []
+        for engine in core.ENGINES:
+            order, collected = core.spiralsorted(nodes, start_node_id,
+                                                 engine=engine,
+                                                 return_order=True,
+                                                 return_stats=True)
+            np.testing.assert_array_equal(
+                order, core.spiralsorted(nodes, start_node_id,
+                                         engine=engine, return_order=True))
+            assert {"check_ids", "radial", "strides", "window", "pop"} \
+                <= set(collected.phases)
+            assert collected.counters["pops"] == len(nodes.index) - 1
+            assert collected.counters["strides"] \
+                == collected.samples["window_size"]["count"]
+            assert collected.counters["slices"] == 1
+            counters.append(collected.counters)
+        # the same pops fall back, as the engines give the same order
+        assert counters[0]["filter_fallbacks"] \
+            == counters[1]["filter_fallbacks"] > 0
+
+        # partition: the same windows fall back, too
+        counters = [
+            core.spiralsorted(nodes, start_node_id, engine=engine,
+                              window_selection="partition",
+                              return_order=True, return_stats=True)[1]
+            .counters
+            for engine in core.ENGINES
+        ]
+        assert counters[0] == counters[1]
+
+
+class TestShared:
+    """shared.py tests"""
+
+    def test_shared_cloud(self, tmp_path):
+        nodes = pd.DataFrame({"node_id": ["b", "a", "c"],
+                              'x': [0., 1., 2.],
+                              'y': [3., 4., 5.],
+                              'z': [6., 7., 8.]})
+        with shared.shared_cloud(nodes, num_orders=2,
+                                 store_dir=str(tmp_path)) as handles:
+            # the handles pickle to a few bytes
+            handles = pickle.loads(pickle.dumps(handles))
+            x = shared.attach(handles['x'], mode='r')
+            assert x.dtype == np.float32
+            np.testing.assert_array_equal(nodes.x, x)
+            np.testing.assert_array_equal(
+                [0, 1, 2], shared.attach(handles["node_code"]))
+            order = shared.attach(handles["order"])
+            assert order.shape == (2, 3)
+            order[1] = [2, 0, 1]
+            np.testing.assert_array_equal(
+                [[0, 0, 0], [2, 0, 1]], shared.attach(handles["order"]))
+            del x, order
+        assert not os.listdir(tmp_path)
+
 
 class TestIo:
     """io.py tests"""
@@ -104,6 +546,92 @@ class TestIo:
         ani_name = "path/to/file.mp4"
         assert ani_name == io.animation_name(input_file_path_mock)
 
+    def test_read_binary_formats(self, tmp_path):
+        data_path = os.path.join("examples", "data_examples",
+                                 "point_cloud_example.csv")
+        nodes = io.read_data_file(data_path).iloc[:100] \
+                  .reset_index(drop=True)
+        xyz = nodes.loc[:, ['x', 'y', 'z']].to_numpy()
+        nodes_numbered = nodes.assign(node_id=np.arange(100).astype(str))
+
+        structured = np.empty(100, dtype=[("node_id", "U6"), ('x', "f8"),
+                                          ('y', "f8"), ('z', "f8")])
+        for column in nodes.columns:
+            structured[column] = nodes[column]
+        np.save(tmp_path / "structured.npy", structured)
+        assert_frame_equal(nodes,
+                           io.read_data_file(str(tmp_path / "structured.npy")))
+        np.save(tmp_path / "xyz.npy", xyz)
+        assert_frame_equal(nodes_numbered,
+                           io.read_data_file(str(tmp_path / "xyz.npy")))
+        np.savez(tmp_path / "cloud.npz", node_id=nodes.node_id.to_numpy(str),
+                 xyz=xyz)
+        assert_frame_equal(nodes,
+                           io.read_data_file(str(tmp_path / "cloud.npz")))
+
+        ply_path = tmp_path / "cloud.ply"
+        with open(ply_path, "wb") as f:
+            f.write(b"ply\nformat binary_big_endian 1.0\ncomment mock\n"
+                    b"element face 2\nproperty uchar flag\n"
+                    b"element vertex 100\nproperty double x\n"
+                    b"property double y\nproperty float z\n"
+                    b"property uchar red\nend_header\n")
+            f.write(bytes([7, 7]))
+            vertices = np.zeros(100, dtype=[('x', ">f8"), ('y', ">f8"),
+                                            ('z', ">f4"), ("red", "u1")])
+            vertices['x'], vertices['y'], vertices['z'] = xyz.T
+            vertices.tofile(f)
+        assert_frame_equal(nodes_numbered, io.read_data_file(str(ply_path)))
+        with open(ply_path, "wb") as f:
+            f.write(b"ply\nelement vertex 1\nproperty float x\nend_header\n")
+        with pytest.raises(ValueError, match="missing format line"):
+            io.read_data_file(str(ply_path))
+        with open(ply_path, "wb") as f:
+            f.write(b"ply\nformat binary_little_endian 1.0\n"
+                    b"element vertex 1\nproperty list uchar int idx\n"
+                    b"end_header\n")
+        with pytest.raises(ValueError, match="at the vertex element"):
+            io.read_data_file(str(ply_path))
+
+        pytest.importorskip("pyarrow")
+        for input_format in ("parquet", "feather"):
+            file_path = str(tmp_path / f"cloud.{input_format}")
+            getattr(nodes.assign(extra=1.5), f"to_{input_format}")(file_path)
+            assert_frame_equal(nodes, io.read_data_file(file_path))
+
+    def test_write_output(self, tmp_path, monkeypatch):
+        data_path = os.path.join("examples", "data_examples",
+                                 "point_cloud_example.csv")
+        nodes = io.read_data_file(data_path).iloc[:100] \
+                  .reset_index(drop=True)
+        monkeypatch.setattr(config, "WRITE_CHUNK", 30)
+
+        io.write_output(nodes, str(tmp_path / "cloud.csv"))
+        csv_expected = nodes.to_csv()
+        assert csv_expected == (tmp_path / "cloud.csv").read_text()
+        # one gzip member per chunk
+        io.write_output(nodes, str(tmp_path / "cloud.csv.gz"), threads=2)
+        with gzip.open(tmp_path / "cloud.csv.gz", "rt") as f:
+            assert csv_expected == f.read()
+        with pytest.raises(ValueError):
+            io.write_output(nodes, str(tmp_path / "cloud.json.gz"))
+
+        io.write_output(nodes, str(tmp_path / "cloud.npy"))
+        assert_frame_equal(nodes,
+                           io.read_data_file(str(tmp_path / "cloud.npy")))
+
+        pytest.importorskip("pyarrow")
+        for output_format in ("parquet", "feather"):
+            file_path = str(tmp_path / f"cloud.{output_format}")
+            io.write_output(nodes, file_path)
+            assert_frame_equal(nodes, io.read_data_file(file_path))
+
+    def test_read_manifest(self, tmp_path):
+        manifest_path = tmp_path / "manifest.csv"
+        manifest_path.write_text("path,start_id\na.csv,N_01\n/b.csv, 002\n")
+        jobs_expected = [(str(tmp_path / "a.csv"), "N_01"), ("/b.csv", "002")]
+        assert jobs_expected == io.read_manifest(str(manifest_path))
+
     def test_read_data_file(self):
         data_path = os.path.join("examples", "data_examples",
                                  "point_cloud_example.csv")
@@ -123,6 +651,21 @@ class TestUtils:
             utils.check_duplicated_ids(nodes_mock_failling)
         assert utils.check_duplicated_ids(nodes_mock_passing) is True
 
+    def test_intern_ids(self):
+        codes, uniques = utils.intern_ids(["N_2", "N_0", "N_1", "N_0"])
+        assert codes.dtype == np.int32
+        np.testing.assert_array_equal(codes, [0, 1, 2, 1])
+        np.testing.assert_array_equal(uniques[codes],
+                                      ["N_2", "N_0", "N_1", "N_0"])
+
+    def test_create_slices(self):
+        for num_nodes in [1500, 4000, 70000, 200000]:
+            slices = utils.create_slices(range(num_nodes))
+            assert slices[0].start == 0
+            assert slices[-1].stop >= num_nodes
+            for prev_slice, next_slice in zip(slices, slices[1:]):
+                assert prev_slice.stop == next_slice.start
+
     def test_calc_half_slice(self):
         assert utils.calc_half_slice(slice(1, 6)) == 2
         assert utils.calc_half_slice(slice(1, 7)) == 3
@@ -150,3 +693,85 @@ class TestUtils:
         captured = capsys.readouterr()
         expected_out = "Sleep_for duration------------0:00:00.10\n"
         assert captured.out == expected_out
+
+
+class TestMain:
+    """__main__.py tests"""
+
+    def test_warmup(self):
+        result = CliRunner().invoke(main, ["--warmup"])
+        assert result.exit_code == 0
+        assert result.output.startswith("Startup duration")
+        num_kernels = len(core.numba_kernels())
+        assert f"{num_kernels} numba kernels at" in result.output
+        if num_kernels:
+            # already compiled or loaded, at the import of core
+            assert num_kernels == sum(
+                sum(kernel.stats.cache_hits.values())
+                + sum(kernel.stats.cache_misses.values())
+                for kernel in core.numba_kernels()
+            )
+        result = CliRunner().invoke(main, [])
+        assert result.exit_code == 2
+        assert "Missing argument 'FILE_PATH'" in result.output
+
+    def test_profile(self, tmp_path):
+        data_path = os.path.join("examples", "data_examples",
+                                 "point_cloud_example.csv")
+        file_path = str(tmp_path / "cloud.csv")
+        nodes = io.read_data_file(data_path).iloc[:300]
+        nodes.to_csv(file_path, index=False)
+        result = CliRunner().invoke(main, [file_path, nodes.node_id.iloc[0],
+                                           "-e", "numpy", "--profile"])
+        assert result.exit_code == 0, result.output
+        pstats_file = io.profile_name(file_path, ".pstats")
+        top = profiling.top_functions(pstats_file, core)
+        assert "spiralsorted" in {row.name for row in top}
+        assert top[0].name in result.output
+        with open(io.profile_name(file_path, ".folded")) as fr:
+            for line in fr:
+                stack, samples = line.rsplit(' ', 1)
+                assert int(samples) > 0
+                assert ';' in stack
+        result = CliRunner().invoke(main, [file_path, "-b", "--profile"])
+        assert result.exit_code == 2
+
+    def test_usage_errors(self, tmp_path):
+        # rejected before the input is read
+        file_path = str(tmp_path / "missing.csv")
+        for args in (["-w", "grid"], ["-w", "grid", "-e", "pandas"],
+                     ["-w", "grid", "-e", "numpy", "-m"]):
+            result = CliRunner().invoke(main, [file_path, "N_0"] + args)
+            assert result.exit_code == 2, args
+            assert "--window-selection grid" in result.output
+        for args in (["-m", "-e", "numpy"], ["-m", "-f", "parquet"]):
+            result = CliRunner().invoke(main, [file_path, "N_0"] + args)
+            assert result.exit_code == 2, args
+            assert "out-of-core mode" in result.output
+
+    def test_sectors(self, tmp_path):
+        data_path = os.path.join("examples", "data_examples",
+                                 "point_cloud_example.csv")
+        file_path = str(tmp_path / "cloud.csv")
+        nodes = io.read_data_file(data_path).iloc[:300]
+        nodes.to_csv(file_path, index=False)
+        # without far slices, the sectors order is the sequential one
+        result = CliRunner().invoke(main, [file_path, nodes.node_id.iloc[0],
+                                           "-s", "4", "--compare"])
+        assert result.exit_code == 0, result.output
+        assert "rank shift mean 0 max 0" in result.output
+        result = CliRunner().invoke(main, [file_path, nodes.node_id.iloc[0],
+                                           "-s", "4", "-e", "numpy"])
+        assert result.exit_code == 2
+        assert "--engine is not supported" in result.output
+
+    def test_lazy_imports(self):
+        # --help, --version and usage errors don't load the heavy modules
+        code = ("import sys; import spiralsort.__main__ as m;"
+                " m.main(['--help'], standalone_mode=False);"
+                " print(*(module in sys.modules"
+                " for module in ('numba', 'numpy', 'pandas')))")
+        run = subprocess.run([sys.executable, "-c", code],
+                             capture_output=True, text=True, check=True,
+                             cwd=os.path.dirname(os.path.dirname(__file__)))
+        assert run.stdout.splitlines()[-1] == "False False False"
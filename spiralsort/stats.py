@@ -0,0 +1,132 @@
+# stats.py is part of SpiralSort
+#
+# SpiralSort is free software; you may redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version. You should have received a copy of the GNU
+# General Public License along with this program. If not, see
+# <https://www.gnu.org/licenses/>.
+#
+# (C) 2020 Athanasios Mattas
+# ======================================================================
+"""Instrumentation of the spiralsorting process.
+
+The instrumented points of the algorithm record phase durations,
+counters, samples (e.g. the spiral_window sizes) and the peak memory of
+the process into the Stats being collected, within collecting(). Outside
+of it, each point is a context variable lookup that finds nothing, so
+instrumentation is free when disabled.
+
+Collection is per thread (and per process), so the workers of the
+parallel modes do not record into the Stats of the caller.
+"""
+
+from collections import namedtuple
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+import json
+import sys
+from timeit import default_timer as timer
+
+try:
+    import resource
+except ModuleNotFoundError:  # pragma: no cover
+    # not available on Windows
+    resource = None
+
+
+# phases   :  name -> seconds (phases may nest, e.g. window and pop in
+#             strides)
+# counters :  name -> count
+# samples  :  name -> {count, total, min, max} of the sampled values
+# peak_rss :  phase -> the peak resident memory of the process (bytes),
+#             at the end of the phase
+Stats = namedtuple("Stats", ["phases", "counters", "samples", "peak_rss"])
+
+_collected = ContextVar("spiralsort_stats", default=None)
+
+_NO_PHASE = nullcontext()
+
+
+def new_stats():
+    """an empty Stats"""
+    return Stats(phases={}, counters={}, samples={}, peak_rss={})
+
+
+@contextmanager
+def collecting(stats=None):
+    """collects the instrumentation of the current thread into stats
+
+    Args:
+        stats (Stats)  :  to keep adding to (default None, a new one)
+
+    Yields:
+        stats (Stats)
+    """
+    if stats is None:
+        stats = new_stats()
+    token = _collected.set(stats)
+    try:
+        yield stats
+    finally:
+        _collected.reset(token)
+
+
+def _peak_rss():
+    """the peak resident memory of the process (bytes), or None"""
+    if resource is None:  # pragma: no cover
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+@contextmanager
+def _timed_phase(stats, name):
+    start = timer()
+    try:
+        yield
+    finally:
+        stats.phases[name] = stats.phases.get(name, 0.) + timer() - start
+        stats.peak_rss[name] = _peak_rss()
+
+
+def phase(name):
+    """a context manager that adds its duration to the phase name"""
+    stats = _collected.get()
+    if stats is None:
+        return _NO_PHASE
+    return _timed_phase(stats, name)
+
+
+def count(name, n=1):
+    """adds n to the counter name"""
+    stats = _collected.get()
+    if stats is not None:
+        stats.counters[name] = stats.counters.get(name, 0) + n
+
+
+def sample(name, value):
+    """adds a value to the samples name"""
+    stats = _collected.get()
+    if stats is None:
+        return
+    samples = stats.samples.get(name)
+    if samples is None:
+        stats.samples[name] = {"count": 1, "total": value,
+                               "min": value, "max": value}
+        return
+    samples["count"] += 1
+    samples["total"] += value
+    samples["min"] = min(samples["min"], value)
+    samples["max"] = max(samples["max"], value)
+
+
+def to_json(stats, output_file=None):
+    """the Stats as a json string, also written to the output_file, if
+    given"""
+    text = json.dumps(stats._asdict(), indent=2, default=float)
+    if output_file is not None:
+        with open(output_file, 'w') as fw:
+            fw.write(text)
+    return text
@@ -9,7 +9,12 @@
 #
 # (C) 2020 Athanasios Mattas
 # ======================================================================
-"""Houses some helper functions"""
+"""Houses some helper functions
+
+The CLI imports utils before it parses the arguments, so numpy and
+pandas are imported by the helpers that need them, instead of at the
+top.
+"""
 
 from datetime import timedelta
 from functools import wraps
@@ -17,15 +22,35 @@ import os
 from timeit import default_timer as timer
 
 import click
-import numpy as np
-import pandas as pd
 
 from spiralsort import config
 
 
+def intern_ids(node_ids):
+    """maps the node_ids to dense int32 codes, hashing the strings once
+
+    Unique node_ids get the codes 0, 1, 2, ..., namely their rows.
+
+    Returns:
+        codes (array)    :  the code of each node_id
+        uniques (array)  :  the node_id of each code
+    """
+    import numpy as np
+    import pandas as pd
+    codes, uniques = pd.factorize(np.asarray(node_ids))
+    if len(uniques) <= np.iinfo(np.int32).max:
+        codes = codes.astype(np.int32)
+    return codes, uniques
+
+
 def check_duplicated_ids(nodes):
     """check node_ids uniqueness"""
-    duplicated_ids = nodes[nodes.node_id.duplicated()].node_id.to_list()
+    import pandas as pd
+    codes, uniques = intern_ids(nodes.node_id)
+    if len(uniques) == len(codes):
+        return True
+    duplicated_ids = \
+        uniques[codes[pd.Series(codes).duplicated().values]].tolist()
     if duplicated_ids:
         raise Exception("node_id column has duplicated entries: {}"
                         .format(duplicated_ids))
@@ -34,6 +59,8 @@ def check_duplicated_ids(nodes):
 
 def point_cloud_mock():
     """creates a mock point-cloud"""
+    import numpy as np
+    import pandas as pd
     np.random.seed(2)
     num_nodes = config.NUM_NODES
 
@@ -72,24 +99,28 @@ def point_cloud_mock():
 def create_slices(nodes):
     """segments nodes into slices, not to work on the whole df
 
+    (nodes can be the df or any sized container of the nodes)
+
     [
         [0, 2000], [2000, 6000], [6000, 14000], [14000, 30000],
         [30000, 62000], [62000, 94000], [94000, 126000], ...
     ]
     """
+    import numpy as np
+    import pandas as pd
     BASE = config.BASE
     CONST_WINDOW = config.CONST_WINDOW
     slice_bins = pd.DataFrame({"bins": [2000, 6000, 14000, 30000, np.inf],
                                "max_exponent": [1, 2, 3, 4, 5]})
-    num_nodes = len(nodes.index)
+    num_nodes = len(nodes)
     max_exponent = slice_bins.loc[slice_bins.bins.searchsorted(num_nodes),
                                   "max_exponent"]
     slices =                                                                  \
         [slice(BASE * (2 ** n - 1), BASE * (2 ** (n + 1) - 1))
          for n in range(max_exponent)]                                        \
         + [slice(start, start + CONST_WINDOW)
-           for start in range(BASE * (2 ** (max_exponent) - 1) + CONST_WINDOW,
-                              len(nodes.index),
+           for start in range(BASE * (2 ** (max_exponent) - 1),
+                              num_nodes,
                               CONST_WINDOW)]
     return slices
 
@@ -114,6 +145,8 @@ def print_duration(start, end, process):
     process_name = {
         "main": "Total",
         "spiralsorted": "SpiralSort",
+        "spiralsorted_file": "SpiralSort",
+        "spiralsorted_sectors": "SpiralSort",
         "animate": "Post-processing"
     }
     if process in process_name:
@@ -124,6 +157,69 @@ def print_duration(start, end, process):
     click.echo(f"{prefix:-<30}{duration}"[:40])
 
 
+def print_jobs_summary(results):
+    """prints the duration of each spiralsorted_many job and the totals
+
+    Args:
+        results (list)  :  the JobResults of the batch
+    """
+    click.echo(f"{'duration':<15}{'nodes':>10}  file start_node_id")
+    for result in sorted(results, key=lambda result: result.duration,
+                         reverse=True):
+        duration = str(timedelta(seconds=result.duration))[:14]
+        status = f"  ({result.error})" if result.error else ""
+        click.echo(f"{duration:<15}{result.num_nodes:>10}"
+                   f"  {result.file_path} {result.start_node_id}{status}")
+    num_failed = sum(result.error is not None for result in results)
+    total = sum(result.duration for result in results)
+    click.echo(f"{len(results)} jobs, {num_failed} failed,"
+               f" {timedelta(seconds=total)} of job time")
+
+
+def print_stats(stats):
+    """prints the phases, the counters and the samples of a Stats (see
+    spiralsort.stats), and the peak memory"""
+    for name, duration in sorted(stats.phases.items(),
+                                 key=lambda phase: phase[1], reverse=True):
+        duration = str(timedelta(seconds=duration))[:14]
+        click.echo(f"{name:<15}{duration:>15}")
+    for name, value in stats.counters.items():
+        click.echo(f"{name:<15}{value:>15}")
+    for name, samples in stats.samples.items():
+        click.echo(f"{name:<15}{samples['total'] / samples['count']:>15.1f}"
+                   f"  (min {samples['min']}, max {samples['max']})")
+    peak_rss = [rss for rss in stats.peak_rss.values() if rss is not None]
+    if peak_rss:
+        click.echo(f"{'peak memory':<15}{max(peak_rss) / 2 ** 20:>12.1f} MB")
+
+
+def print_top_functions(top):
+    """prints the top functions of a profile (see
+    profiling.top_functions)"""
+    click.echo(f"{'function':<30}{'calls':>10}{'own (s)':>12}"
+               f"{'total (s)':>12}")
+    for row in top:
+        click.echo(f"{row.name[:29]:<30}{row.ncalls:>10}{row.tottime:>12.4f}"
+                   f"{row.cumtime:>12.4f}")
+
+
+def print_quality(quality):
+    """prints a SpiralQuality (see core.spiral_quality)"""
+    click.echo(f"path length {quality.path_length:.6g},"
+               f" max step {quality.max_step:.6g},"
+               f" counterclockwise steps {quality.counterclockwise:.1%}")
+
+
+def print_difference(difference):
+    """prints a SpiralDifference (see core.spiral_difference)"""
+    click.echo(f"against the sequential order: path length"
+               f" {difference.path_length:+.2%}, max step"
+               f" {difference.max_step:+.2%}, counterclockwise steps"
+               f" {difference.counterclockwise * 100:+.1f} points, rank"
+               f" shift mean {difference.mean_rank_shift:.6g} max"
+               f" {difference.max_rank_shift}")
+
+
 def time_this(f):
     """function timer decorator
 